@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# images of a directory preprocessed once into ±1 int8 vectors, stored next to the directory in
+# .dataset_cache/ and memory-mapped on load; only new or changed files are decoded again
+CACHE_DIR = ".dataset_cache"
+CACHE_FORMAT = 1
+IMAGE_EXTENSIONS = ('.gif', '.png', '.bmp', '.jpg', '.jpeg')
+
+
+def load_image(image_path: str, width: int, height: int, threshold: int | None = None) -> np.ndarray:
+    # black pixels are 1, white pixels are -1
+    from PIL import Image
+    with Image.open(image_path) as im:
+        if im.size != (width, height):
+            im = im.resize((width, height))
+        if threshold is None:
+            # 1-bit pixels, black and white, pillow dithers the greyscale:
+            # https://pillow.readthedocs.io/en/latest/handbook/concepts.html#concept-modes
+            white = np.asarray(im.convert('1', colors=2))
+        else:
+            white = np.asarray(im.convert('L')) >= threshold
+        return np.where(white, -1, 1).astype(np.int8).ravel()
+
+
+def image_label(name: str) -> str:
+    # 4-08.gif and 4.gif are both images of 4
+    return os.path.splitext(name)[0].split('-')[0]
+
+
+def file_hash(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class ImageDataset:
+    names: list[str]
+    labels: list[str]
+    vectors: np.ndarray
+
+    def __init__(self, directory: str, width: int, height: int, threshold: int | None = None) -> None:
+        self.directory = directory
+        self.width = width
+        self.height = height
+        self.threshold = threshold
+        directory = os.path.abspath(directory)
+        mode = 'dither' if threshold is None else f"t{threshold}"
+        base = os.path.join(os.path.dirname(directory), CACHE_DIR, f"{os.path.basename(directory)}-{width}x{height}-{mode}")
+        self.index_path = base + ".json"
+        self.vectors_path = base + ".npy"
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def path(self, row: int) -> str:
+        return os.path.join(self.directory, self.names[row])
+
+    def read_cache(self) -> tuple[list, np.ndarray | None]:
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            vectors = np.load(self.vectors_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return [], None
+        if index.get('format') != CACHE_FORMAT or len(index['files']) != len(vectors):
+            return [], None
+        return index['files'], vectors
+
+    def write_cache(self, files: list, vectors: np.ndarray) -> None:
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        # write aside and swap, so a concurrent reader sees either the old or the new cache
+        with open(self.vectors_path + ".tmp", 'wb') as f:
+            np.save(f, vectors)
+        os.replace(self.vectors_path + ".tmp", self.vectors_path)
+        with open(self.index_path + ".tmp", 'w') as f:
+            json.dump({'format': CACHE_FORMAT, 'files': files}, f)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def load(self) -> 'ImageDataset':
+        cached_files, cached_vectors = self.read_cache()
+        by_name = {entry['name']: row for row, entry in enumerate(cached_files)}
+        by_hash = {entry['sha1']: row for row, entry in enumerate(cached_files)}
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith('.'))
+        files = []
+        rows = []
+        changed = False
+        for name in names:
+            stat = os.stat(os.path.join(self.directory, name))
+            row = by_name.get(name)
+            if row is not None and cached_files[row]['size'] == stat.st_size and cached_files[row]['mtime'] == stat.st_mtime_ns:
+                # unchanged file, not even hashed
+                sha1 = cached_files[row]['sha1']
+            else:
+                sha1 = file_hash(os.path.join(self.directory, name))
+                row = by_hash.get(sha1)
+                changed = True
+            files.append({'name': name, 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': sha1})
+            # a cached row or the decoded image
+            rows.append(row if row is not None else load_image(os.path.join(self.directory, name), self.width, self.height, self.threshold))
+        changed = changed or [entry['name'] for entry in cached_files] != names
+        if changed:
+            vectors = np.empty((len(names), self.width * self.height), dtype=np.int8)
+            for i, row in enumerate(rows):
+                vectors[i] = cached_vectors[row] if isinstance(row, int) else row
+            self.write_cache(files, vectors)
+            if len(vectors):
+                vectors = np.load(self.vectors_path, mmap_mode='r')
+        elif cached_vectors is not None:
+            vectors = cached_vectors
+        else:
+            # empty directory, nothing cached
+            vectors = np.empty((0, self.width * self.height), dtype=np.int8)
+        self.names = names
+        self.labels = [image_label(name) for name in names]
+        self.vectors = vectors
+        return self
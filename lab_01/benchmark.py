@@ -0,0 +1,186 @@
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from nine import (
+    Board, Done, DistanceOracle, Eights, SOLVERS,
+    LeftHand, Manhattan, ManhattanSingle, ManhattanDescendants, RandomChoice,
+)
+
+RESULT_STATE = [1, 2, 3, 8, 0, 4, 7, 6, 5]
+DEPTHS = [4, 8, 12, 16, 20, 24, 28]
+EVRISTIC_CLASSES = [LeftHand, Manhattan, ManhattanSingle, ManhattanDescendants, RandomChoice]
+
+
+def heuristic_factory(*evristic_classes):
+    # DFS of Eights voting with the given heuristics
+    def factory(input_state: list, result_state: list) -> Eights:
+        eights = Eights(input_state, result_state)
+        eights.evristic_classes.extend(evristic_classes)
+        return eights
+    return factory
+
+
+def strategies() -> dict:
+    # name -> factory(input_state, result_state) of a ready to compute() Eights
+    found = dict(SOLVERS)
+    for evr in EVRISTIC_CLASSES:
+        found[f"dfs-{evr.__name__}"] = heuristic_factory(evr)
+    found["dfs-vote"] = heuristic_factory(*EVRISTIC_CLASSES)
+    return found
+
+
+def make_corpus(seed: int, depths: list, per_depth: int, oracle: DistanceOracle, attempts: int = 1000000) -> list:
+    # solvable boards with a known optimal depth: short random walks for shallow depths, shuffles for deep ones
+    rng = random.Random(seed)
+    board = Board.of_state(RESULT_STATE)
+    goal = board.pack(RESULT_STATE)
+    corpus = []
+    for depth in depths:
+        found = 0
+        for _ in range(attempts):
+            if depth <= 20:
+                packed = goal
+                for _ in range(depth):
+                    packed = board.move(packed, rng.choice(board.possible_moves[board.zero_index(packed)]))
+                state = board.unpack(packed)
+            else:
+                state = RESULT_STATE.copy()
+                rng.shuffle(state)
+            if oracle.distance(state) == depth:
+                corpus.append((depth, state))
+                found += 1
+                if found == per_depth:
+                    break
+        if found < per_depth:
+            # deepest boards are rare (and the deepest depth depends on the goal), give up instead of spinning
+            raise ValueError(f"found {found} of {per_depth} boards at depth {depth} in {attempts} attempts")
+    return corpus
+
+
+def run_once(factory, input_state: list, seed: int, trace_memory: bool):
+    # returns (eights, seconds, peak bytes or None), solver setup (tables, databases) stays out of the measurement
+    eights = factory(input_state, RESULT_STATE)
+    random.seed(seed)
+    if trace_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    try:
+        eights.compute()
+        solved = False
+    except Done:
+        solved = True
+    seconds = time.perf_counter() - start_time
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return eights if solved else None, seconds, peak
+
+
+def benchmark(names: list, corpus: list, seed: int, trace_memory: bool = True):
+    # yields one result record per strategy and board
+    available = strategies()
+    for name in names:
+        factory = available[name]
+        for number, (depth, state) in enumerate(corpus):
+            eights, seconds, _ = run_once(factory, state, seed + number, False)
+            peak = None
+            if trace_memory:
+                # separate traced run, tracemalloc slows allocations down too much to time them
+                _, _, peak = run_once(factory, state, seed + number, True)
+            record = {
+                "strategy": name,
+                "board": Eights.to_str(state),
+                "depth": depth,
+                "solved": eights is not None,
+                "nodes": eights.ITER if eights else None,
+                "seconds": seconds,
+                "states_per_sec": eights.ITER / seconds if eights and seconds else None,
+                "path_length": len(eights.PATH) if eights else None,
+                "excess": len(eights.PATH) - depth if eights else None,
+                "peak_bytes": peak,
+            }
+            yield record
+
+
+def summarize(records: list) -> dict:
+    # strategy -> totals over the corpus
+    summary = dict()
+    for record in records:
+        total = summary.setdefault(record["strategy"], {
+            "boards": 0, "solved": 0, "nodes": 0, "seconds": 0.0, "excess": 0, "peak_bytes": 0,
+        })
+        total["boards"] += 1
+        total["seconds"] += record["seconds"]
+        if record["solved"]:
+            total["solved"] += 1
+            total["nodes"] += record["nodes"]
+            total["excess"] += record["excess"]
+        if record["peak_bytes"] is not None:
+            total["peak_bytes"] = max(total["peak_bytes"], record["peak_bytes"])
+    return summary
+
+
+def print_summary(summary: dict):
+    print(f"{'strategy':<26}{'solved':>8}{'nodes':>12}{'states/sec':>14}{'seconds':>10}{'excess':>8}{'peak KB':>10}")
+    for name, total in summary.items():
+        rate = total["nodes"] / total["seconds"] if total["seconds"] else 0
+        print(f"{name:<26}{total['solved']:>5}/{total['boards']:<2}{total['nodes']:>12}{rate:>14.0f}"
+              f"{total['seconds']:>10.3f}{total['excess']:>8}{total['peak_bytes'] // 1024:>10}")
+
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> list:
+    # strategies whose nodes, time or peak memory grew more than `tolerance` times against the baseline
+    regressions = []
+    for name, total in summary.items():
+        if name not in baseline:
+            continue
+        for key in ["nodes", "seconds", "peak_bytes"]:
+            before = baseline[name][key]
+            if before and total[key] > before * tolerance:
+                regressions.append(f"{name}: {key} {before} -> {total[key]}")
+    return regressions
+
+
+def load_records(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the 8-puzzle solvers and heuristics")
+    parser.add_argument("--strategies", nargs="+", default=list(strategies()), choices=list(strategies()))
+    parser.add_argument("--depths", nargs="+", type=int, default=DEPTHS)
+    parser.add_argument("--per-depth", type=int, default=3, help="boards per optimal depth")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run for peak memory")
+    parser.add_argument("--output", help="write one JSON record per run to this file")
+    parser.add_argument("--baseline", help="JSON lines of an earlier --output to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.2,
+                        help="allowed growth against the baseline before a strategy counts as regressed")
+    args = parser.parse_args()
+
+    oracle = DistanceOracle(RESULT_STATE).load()
+    corpus = make_corpus(args.seed, args.depths, args.per_depth, oracle)
+    records = []
+    output = open(args.output, "w") if args.output else None
+    for record in benchmark(args.strategies, corpus, args.seed, not args.no_memory):
+        records.append(record)
+        if output:
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+    if output:
+        output.close()
+
+    summary = summarize(records)
+    print_summary(summary)
+    if args.baseline:
+        regressions = compare(summary, summarize(load_records(args.baseline)), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
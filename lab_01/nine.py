@@ -1,7 +1,110 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from heapq import heappush, heappop
 from random import choice
+import argparse
+import math
+import mmap
+import os
+import random
+import sys
 import time
 import tracemalloc
 
+def rank_state(state: list) -> int:
+    # Lehmer code of the permutation: index of the board among all len(state)! orderings
+    rank = 0
+    used = 0
+    cells = len(state)
+    for i, number in enumerate(state):
+        # tiles smaller than `number` still to come = smaller tiles not used yet
+        rank = rank * (cells - i) + number - (used & ((1 << number) - 1)).bit_count()
+        used |= 1 << number
+    return rank
+
+
+class Board:
+    # tables of one board size, built once per side length and shared by every solver;
+    # packed state layout: `tile_bits` per tile, tile of cell i lives in bits [tile_bits*i, tile_bits*(i+1)),
+    # blank (zero) index is kept above the board bits
+    BOARDS: dict = {}
+
+    def __init__(self, side: int):
+        self.side = side
+        self.cells = side * side
+        self.tile_bits = max(4, (self.cells - 1).bit_length())
+        self.tile_mask = (1 << self.tile_bits) - 1
+        self.zero_shift = self.tile_bits * self.cells
+        self.rows = [cell // side for cell in range(self.cells)]
+        self.columns = [cell % side for cell in range(self.cells)]
+        # neighbours in ascending order: up, left, right, down
+        self.possible_moves = dict()
+        for cell in range(self.cells):
+            moves = []
+            if self.rows[cell] > 0:
+                moves.append(cell - side)
+            if self.columns[cell] > 0:
+                moves.append(cell - 1)
+            if self.columns[cell] < side - 1:
+                moves.append(cell + 1)
+            if self.rows[cell] < side - 1:
+                moves.append(cell + side)
+            self.possible_moves[cell] = moves
+        # zero index -> [(move, moved tile shift, zero tile shift, zero index delta), ...]
+        self.swaps = dict()
+        for zero_in, moves in self.possible_moves.items():
+            self.swaps[zero_in] = [
+                (move, self.tile_bits * move, self.tile_bits * zero_in, (move - zero_in) << self.zero_shift)
+                for move in moves
+            ]
+        self.goals = dict()
+
+    @classmethod
+    def of_size(cls, side: int):
+        if side not in cls.BOARDS:
+            cls.BOARDS[side] = cls(side)
+        return cls.BOARDS[side]
+
+    @classmethod
+    def of_state(cls, state: list):
+        side = math.isqrt(len(state))
+        if side * side != len(state):
+            raise ValueError(f"{len(state)} tiles do not make a square board")
+        return cls.of_size(side)
+
+    def pack(self, state: list) -> int:
+        packed = state.index(0) << self.zero_shift
+        for i, number in enumerate(state):
+            packed |= number << (self.tile_bits * i)
+        return packed
+
+    def unpack(self, packed: int) -> list:
+        return [(packed >> (self.tile_bits * i)) & self.tile_mask for i in range(self.cells)]
+
+    def zero_index(self, packed: int) -> int:
+        return packed >> self.zero_shift
+
+    def move(self, packed: int, move: int) -> int:
+        zero_in = packed >> self.zero_shift
+        tile = (packed >> (self.tile_bits * move)) & self.tile_mask
+        return packed - (tile << (self.tile_bits * move)) + (tile << (self.tile_bits * zero_in)) \
+            + ((move - zero_in) << self.zero_shift)
+
+    def goal_table(self, resulting_state: list):
+        # (goal cell of every tile, Manhattan distance of every tile from every cell to its goal)
+        key = tuple(resulting_state)
+        if key not in self.goals:
+            goal_index = [0] * self.cells
+            for cell, number in enumerate(resulting_state):
+                goal_index[number] = cell
+            distances = [
+                [abs(self.rows[cell] - self.rows[goal]) + abs(self.columns[cell] - self.columns[goal])
+                 for cell in range(self.cells)]
+                for goal in goal_index
+            ]
+            self.goals[key] = (goal_index, distances)
+        return self.goals[key]
+
 
 class Done(Exception):
     
@@ -19,40 +122,48 @@ class Eights:
     # index:                 0  1  2  3  4  5  6  7  8
     RES_STATE: list = []     # = [1, 2, 3, 8, 0, 4, 7, 6, 5]
     STATE: list = []         # = INP_STATE.copy()
-    POSSIBLE_MOVES: dict = {
-        0: [1, 3],
-        1: [0, 2, 4],
-        2: [1, 5],
-        3: [0, 4, 6],
-        4: [1, 3, 5, 7],
-        5: [2, 4, 8],
-        6: [3, 7],
-        7: [4, 6, 8],
-        8: [5, 7]
-    }
-    CHECKED_STATES: list = []
+    board: Board = Board.of_size(3)
+    # neighbours of the board size, 3x3: {0: [1, 3], 1: [0, 2, 4], ..., 4: [1, 3, 5, 7], ..., 8: [5, 7]}
+    POSSIBLE_MOVES: dict = board.possible_moves
+    SWAPS: dict = board.swaps
+    PACKED: int = 0
+    RES_PACKED: int = 0
+    CHECKED_STATES: set = set()
     UNCHECKED_STATES: list = []
+    evristics: list = []     # one reusable instance per class in evristic_classes
     ITER: int = 0
     PATH: list = []
+    PARENTS: dict = {}       # packed state -> packed state it was pushed from, None for the start state
 
     def __init__(self, input_state: list, result_state: list):
         self.INP_STATE = input_state
         self.RES_STATE = result_state
         self.STATE = input_state.copy()
-        self.CHECKED_STATES = []
+        self.board = Board.of_state(input_state)
+        self.POSSIBLE_MOVES = self.board.possible_moves
+        self.SWAPS = self.board.swaps
+        self.PACKED = self.board.pack(input_state)
+        self.RES_PACKED = self.board.pack(result_state)
+        self.CHECKED_STATES = set()
         self.UNCHECKED_STATES = []
         self.ITER = 0
         self.evristic_classes = []
+        self.evristics = []
         self.PATH = []
+        self.PARENTS = {}
 
-    def select_best_move(self, available_moves: list):
+    def select_best_move(self, children: list):
+        # children: (move, packed child state) pairs still available
         if not self.evristic_classes:
-            return available_moves[0]
-        
-        bests = dict()
+            return children[0][0]
+        if len(self.evristics) != len(self.evristic_classes):
+            # classes may be appended after __init__, instantiate them once on the first vote
+            self.evristics = [evr(self) for evr in self.evristic_classes]
 
-        for evr in self.evristic_classes:
-            e_res = evr(self.STATE, available_moves, self.RES_STATE, self).decide()
+        bests = dict()
+        zero_in = self.PACKED >> self.board.zero_shift
+        for evr in self.evristics:
+            e_res = evr.decide(self.PACKED, zero_in, children)
             bests.setdefault(e_res, 0)
             bests[e_res] = bests[e_res] + 1
 
@@ -67,51 +178,70 @@ class Eights:
         # print(f"Best move is: {best_choice}")
         return best_choice
 
-    def available_moves(self):
-        moves = []
-        # print(f"Possible moves: {self.POSSIBLE_MOVES.get(self.STATE.index(0))}")
-        for possible_move in self.POSSIBLE_MOVES.get(self.STATE.index(0)):
-            # print(f"Check is available move: {possible_move}")
-            to_check_state = self.STATE.copy()
-            zero_in = to_check_state.index(0)
-            to_check_state[possible_move], to_check_state[zero_in] = to_check_state[zero_in], to_check_state[possible_move]
-            if self.to_str(to_check_state) in self.CHECKED_STATES:
-                # print(f"{to_check_state} in CHECKED_STATES")
+    def available_children(self, packed: int) -> list:
+        # (move, packed child state) pairs not checked yet
+        children = []
+        tile_mask = self.board.tile_mask
+        for move, move_shift, zero_shift, zero_delta in self.SWAPS[packed >> self.board.zero_shift]:
+            tile = (packed >> move_shift) & tile_mask
+            child = packed - (tile << move_shift) + (tile << zero_shift) + zero_delta
+            if child in self.CHECKED_STATES:
                 continue
-            moves.append(possible_move)
-        return moves
+            children.append((move, child))
+        return children
+
+    def available_moves(self):
+        return [move for move, _ in self.available_children(self.PACKED)]
 
     def make_move(self):
         self.ITER += 1
-        # print(f"Checking state: {self.STATE}")
         if self.is_result_state():
-            # print(f"DONE!!! Result is: {state}, iterations: {i}")
-            raise Done(self.STATE, self.ITER)
-            # exit(1)
-        self.CHECKED_STATES.append(self.to_str(self.STATE))
-        available = self.available_moves()
-        # print(f"Available moves: {available}")
+            # only the branch that reached the result, abandoned branches are not part of the path
+            self.PATH = self.rebuild_path(self.PARENTS, self.PACKED)
+            raise Done(self.board.unpack(self.PACKED), self.ITER)
+        self.CHECKED_STATES.add(self.PACKED)
+        available = self.available_children(self.PACKED)
         if not available:
-            # self.make_move()
             return
-        # print(f"Available moves: {available}")
         best_move = self.select_best_move(available)
-        # print(f"Best move: {best_move}")
-        other_moves = list(set(available) - {best_move})
+        children = dict(available)
+        other_moves = list(set(children) - {best_move})
         for other_move in other_moves:
-            to_check_state = self.STATE.copy()
-            to_check_state[other_move], to_check_state[to_check_state.index(0)] = to_check_state[to_check_state.index(0)], to_check_state[other_move]
-            # print(f"Saving {other_move}")
-            self.UNCHECKED_STATES.append(self.to_str(to_check_state))
-        zero_in = self.STATE.index(0)
-        # print(f"Zero in: {zero_in}")
-        self.PATH.append(best_move)
-        self.STATE[best_move], self.STATE[zero_in] = self.STATE[zero_in], self.STATE[best_move]
-        # print(f"Updated state: {self.STATE}")
-        self.UNCHECKED_STATES.append(self.to_str(self.STATE))
+            self.UNCHECKED_STATES.append(children[other_move])
+            self.PARENTS[children[other_move]] = self.PACKED
+        self.PARENTS[children[best_move]] = self.PACKED
+        self.PACKED = children[best_move]
+        self.UNCHECKED_STATES.append(self.PACKED)
 
     def is_result_state(self):
-        return self.STATE == self.RES_STATE
+        return self.PACKED == self.RES_PACKED
+
+    def is_solvable(self):
+        return self.parity(self.INP_STATE) == self.parity(self.RES_STATE)
+
+    def parity(self, state: list):
+        # a vertical move jumps a tile over side - 1 others: on odd widths the inversions parity never changes,
+        # on even widths it flips together with the blank row
+        inversions = self.count_inversions(state)
+        if self.board.side % 2 == 0:
+            inversions += self.board.rows[state.index(0)]
+        return inversions % 2
+
+    @staticmethod
+    def count_inversions(state: list):
+        tiles = [number for number in state if number != 0]
+        return sum(1 for i in range(len(tiles)) for j in range(i + 1, len(tiles)) if tiles[i] > tiles[j])
+
+    def rebuild_path(self, parents: dict, packed: int):
+        # parents: packed state -> packed parent state, None for the start state;
+        # the move into a state is where its blank is, so the parent alone is enough
+        path = []
+        zero_shift = self.board.zero_shift
+        while parents[packed] is not None:
+            path.append(packed >> zero_shift)
+            packed = parents[packed]
+        path.reverse()
+        return path
 
     @staticmethod
     def to_str(state: list):
@@ -122,229 +252,829 @@ class Eights:
         return list(map(int, [*state]))
 
     def compute(self):
-        self.UNCHECKED_STATES.append(self.to_str(self.STATE))
+        self.PARENTS[self.PACKED] = None
+        self.UNCHECKED_STATES.append(self.PACKED)
         while len(self.UNCHECKED_STATES) > 0:
-            self.STATE = self.to_list(self.UNCHECKED_STATES.pop())
+            self.PACKED = self.UNCHECKED_STATES.pop()
             self.make_move()
             # if self.ITER >= 3:
             #     break
 
 
 class Evristics:
-    state: list = []
-    available_moves: list = []
-    resulting_state: list = []
+    # stateless scorer: built once per Eights and reused for every move,
+    # reads the goal table of the board instead of searching the resulting state
     eights = None
+    board: Board = None
+    distances: list = []     # tile -> cell -> Manhattan distance to the tile's goal cell
 
-    def __init__(self, state: list, available_moves: list, resulting_state: list, obj: Eights = None):
-        self.state = state
-        self.available_moves = available_moves
-        self.resulting_state = resulting_state
+    def __init__(self, obj: Eights):
         self.eights = obj
+        self.board = obj.board
+        _, self.distances = obj.board.goal_table(obj.RES_STATE)
 
-    def decide(self):
-        raise
-
-
-class LeftHand(Evristics):
-    def decide(self):
-        return self.available_moves[0]
-
-
-class Manhattan(Evristics):
-    def decide(self):
-        # print("Manhattan decides")
-        # return choice(self.available_moves)
-        distances = dict()
-        for possible_move in self.available_moves:
-            # make a move
-            next_state = self.state.copy()
-            zero_cell = next_state.index(0)
-            next_state[possible_move], next_state[zero_cell] = next_state[zero_cell], next_state[possible_move]
-            distances.setdefault(possible_move, self.compute_distance(next_state))
+    def decide(self, packed: int, zero_in: int, children: list):
+        # packed state, its blank index, (move, packed child state) pairs -> chosen move
+        raise NotImplementedError
 
+    @staticmethod
+    def closest(scores):
+        # move with the smallest score, the last one wins a tie
         best_choice = None
         shortest_distance = None
-        for p_move, distance in distances.items():
+        for p_move, distance in scores:
             if shortest_distance is None or distance <= shortest_distance:
                 shortest_distance = distance
                 best_choice = p_move
-        # print(f"Shortest: {best_choice}")
         return best_choice
 
+
+class LeftHand(Evristics):
+    def decide(self, packed: int, zero_in: int, children: list):
+        return children[0][0]
+
+
+class Manhattan(Evristics):
+    # smallest Manhattan distance of the whole board (blank included) after the move;
+    # the board distance before the move is shared by all moves, so only the two changed cells are scored
+    def decide(self, packed: int, zero_in: int, children: list):
+        blank = self.distances[0]
+        return self.closest(
+            (move, self.tile_delta(packed, zero_in, move) + blank[move] - blank[zero_in])
+            for move, _ in children
+        )
+
+    def tile_delta(self, packed: int, zero_in: int, move: int):
+        # distance change of the tile sliding from `move` into the blank at `zero_in`
+        tile = (packed >> (self.board.tile_bits * move)) & self.board.tile_mask
+        distances = self.distances[tile]
+        return distances[zero_in] - distances[move]
+
     def compute_distance(self, state: list):
-        state_distance = 0
-        for i in range(len(state)):
-            state_distance += self.compute_single_distance(state, i)
-        return state_distance
+        return sum(self.distances[number][cell] for cell, number in enumerate(state))
 
     def compute_single_distance(self, state: list, cell_index: int):
-        number = state[cell_index]
-        resulting_index = self.resulting_state.index(number)
-        # identify vetical diff
-        vertical_diff = abs(self.compute_row(cell_index) - self.compute_row(resulting_index))
-        # identofy horizontal diff
-        horizontal_diff = abs(self.compute_column(cell_index) - self.compute_column(resulting_index))
-        return vertical_diff + horizontal_diff
+        return self.distances[state[cell_index]][cell_index]
 
     @staticmethod
-    def compute_column(cell_index: int):
-        if cell_index in [0, 3, 6]:
-            return 1
-        elif cell_index in [1, 4, 7]:
-            return 2
-        elif cell_index in [2, 5, 8]:
-            return 3
-        else:
-            raise
+    def compute_column(cell_index: int, side: int = 3):
+        return Board.of_size(side).columns[cell_index] + 1
 
     @staticmethod
-    def compute_row(cell_index: int):
-        if cell_index in [0, 1, 2]:
-            return 1
-        elif cell_index in [3, 4, 5]:
-            return 2
-        elif cell_index in [6, 7, 8]:
-            return 3
-        else:
-            raise
+    def compute_row(cell_index: int, side: int = 3):
+        return Board.of_size(side).rows[cell_index] + 1
 
 
 class ManhattanSingle(Manhattan):
-    def decide(self):
-        distances = dict()
-        for possible_move in self.available_moves:
-            # make a move
-            next_state = self.state.copy()
-            zero_cell = next_state.index(0)
-            # check current cell distance
-            curr_dist = self.compute_single_distance(next_state, possible_move)
-            # check distance after movement
-            next_state[possible_move], next_state[zero_cell] = next_state[zero_cell], next_state[possible_move]
-            next_dist = self.compute_single_distance(next_state, zero_cell)
-            distances.setdefault(possible_move, next_dist - curr_dist)
-
-        best_choice = None
-        shortest_distance = None
-        for p_move, distance in distances.items():
-            if shortest_distance is None or distance <= shortest_distance:
-                shortest_distance = distance
-                best_choice = p_move
-        # print(f"Shortest ManhattanSingle: {best_choice}")
-        return best_choice
+    # smallest distance change of the moved tile alone
+    def decide(self, packed: int, zero_in: int, children: list):
+        return self.closest((move, self.tile_delta(packed, zero_in, move)) for move, _ in children)
 
 
 class ManhattanDescendants(Manhattan):
-    def decide(self):
-        distances = dict()
-        for possible_move in self.available_moves:
-            # make a move
-            next_state = self.state.copy()
-            zero_cell = next_state.index(0)
-            # check current cell distance
-            # curr_dist = self.compute_single_distance(next_state, possible_move)
-            # check distance after movement
-            next_state[possible_move], next_state[zero_cell] = next_state[zero_cell], next_state[possible_move]
-            # next_dist = self.compute_single_distance(next_state, zero_cell)
-            distances.setdefault(possible_move, 0)
-            for child_move in self.next_available_moves(next_state):
-                child_state = next_state.copy()
-                child_zero_cell = child_state.index(0)
-                # check current cell distance
-                curr_dist = self.compute_single_distance(child_state, child_move)
-                # check distance after movement
-                child_state[child_move], child_state[child_zero_cell] = child_state[child_zero_cell], child_state[child_move]
-                next_dist = self.compute_single_distance(child_state, child_zero_cell)
-                distances[possible_move] += next_dist - curr_dist
-
-        best_choice = None
-        shortest_distance = None
-        for p_move, distance in distances.items():
-            if shortest_distance is None or distance <= shortest_distance:
-                shortest_distance = distance
-                best_choice = p_move
-        # print(f"Shortest ManhattanDescendants: {best_choice}")
-        return best_choice
+    # smallest sum of the moved tile deltas over the moves still available from the child
+    def decide(self, packed: int, zero_in: int, children: list):
+        return self.closest(
+            (move, sum(self.tile_delta(child, move, child_move) for child_move, _ in self.eights.available_children(child)))
+            for move, child in children
+        )
 
     def next_available_moves(self, state: list):
-        moves = []
-        for possible_move in self.eights.POSSIBLE_MOVES.get(state.index(0)):
-            to_check_state = state.copy()
-            zero_in = to_check_state.index(0)
-            to_check_state[possible_move], to_check_state[zero_in] = to_check_state[zero_in], to_check_state[
-                possible_move]
-            if self.eights.to_str(to_check_state) in self.eights.CHECKED_STATES:
-                continue
-            moves.append(possible_move)
-        return moves
+        return [move for move, _ in self.eights.available_children(self.board.pack(state))]
 
 
 class RandomChoice(Evristics):
-    def decide(self):
-        # print("RandomChoice decides")
-        return choice(self.available_moves)
+    def decide(self, packed: int, zero_in: int, children: list):
+        return choice(children)[0]
 
 
-def print_best_result(input_state, path, on_row=10):
-    def format_matrix(state):
-        return ""
-    all_states = []
-    all_states.append(input_state)
+class ConflictDistance:
+    # admissible distance for packed states: Manhattan distance of the tiles (blank excluded)
+    # plus 2 moves for every tile that has to leave its goal row/column to let others pass
+    def __init__(self, resulting_state: list):
+        self.board = board = Board.of_state(resulting_state)
+        goal_index, distances = board.goal_table(resulting_state)
+        self.distances = [[0] * board.cells] + distances[1:]
+        # every line is (cells, key of tile in line order or -1 when tile's goal is not in this line)
+        self.lines = []
+        for line in range(board.side):
+            row_cells = [line * board.side + column for column in range(board.side)]
+            row_keys = [board.columns[goal] if number and board.rows[goal] == line else -1
+                        for number, goal in enumerate(goal_index)]
+            self.lines.append((row_cells, row_keys))
+            column_cells = [row * board.side + line for row in range(board.side)]
+            column_keys = [board.rows[goal] if number and board.columns[goal] == line else -1
+                           for number, goal in enumerate(goal_index)]
+            self.lines.append((column_cells, column_keys))
+
+    def compute(self, packed: int) -> int:
+        tiles = self.board.unpack(packed)
+        distance = 0
+        for cell, number in enumerate(tiles):
+            distance += self.distances[number][cell]
+        return distance + 2 * self.compute_conflicts(tiles)
+
+    def compute_conflicts(self, tiles: list) -> int:
+        conflicts = 0
+        for cells, keys in self.lines:
+            sequence = [keys[tiles[cell]] for cell in cells if keys[tiles[cell]] >= 0]
+            if len(sequence) > 1:
+                # tiles outside the longest increasing run have to step out of the line
+                conflicts += len(sequence) - self.longest_increasing(sequence)
+        return conflicts
+
+    @staticmethod
+    def longest_increasing(sequence: list) -> int:
+        lengths = [1] * len(sequence)
+        for i in range(len(sequence)):
+            for j in range(i):
+                if sequence[j] < sequence[i] and lengths[j] + 1 > lengths[i]:
+                    lengths[i] = lengths[j] + 1
+        return max(lengths)
+
+
+class AStarEights(Eights):
+    # optimal solver: A* over packed states guided by ConflictDistance,
+    # ITER counts expanded states, PATH is a shortest path
+    def __init__(self, input_state: list, result_state: list):
+        super().__init__(input_state, result_state)
+        self.distance = ConflictDistance(result_state)
+
+    def compute(self):
+        if not self.is_solvable():
+            return
+        self.PARENTS = {self.PACKED: None}
+        costs = {self.PACKED: 0}
+        # (f, -g, packed): among equal f prefer the deeper state
+        frontier = [(self.distance.compute(self.PACKED), 0, self.PACKED)]
+        while frontier:
+            _, cost, packed = heappop(frontier)
+            cost = -cost
+            if packed in self.CHECKED_STATES:
+                continue
+            self.ITER += 1
+            if packed == self.RES_PACKED:
+                self.PACKED = packed
+                self.PATH = self.rebuild_path(self.PARENTS, packed)
+                raise Done(self.board.unpack(packed), self.ITER)
+            self.CHECKED_STATES.add(packed)
+            child_cost = cost + 1
+            for move, child in self.available_children(packed):
+                if costs.get(child, child_cost + 1) <= child_cost:
+                    continue
+                costs[child] = child_cost
+                self.PARENTS[child] = packed
+                heappush(frontier, (child_cost + self.distance.compute(child), -child_cost, child))
+
+
+class IDAStarEights(AStarEights):
+    # memory-bounded optimal solver: iterative deepening on f = g + ConflictDistance,
+    # keeps only the current path in memory
+    def compute(self):
+        if not self.is_solvable():
+            return
+        bound = self.distance.compute(self.PACKED)
+        while True:
+            self.PATH = []
+            bound = self.search(self.PACKED, 0, bound, -1)
+
+    def search(self, packed: int, cost: int, bound: int, came_from: int) -> int:
+        self.ITER += 1
+        estimate = cost + self.distance.compute(packed)
+        if estimate > bound:
+            return estimate
+        if packed == self.RES_PACKED:
+            self.PACKED = packed
+            raise Done(self.board.unpack(packed), self.ITER)
+        next_bound = None
+        zero_in = packed >> self.board.zero_shift
+        for move, move_shift, zero_shift, zero_delta in self.SWAPS[zero_in]:
+            # never step the blank straight back
+            if move == came_from:
+                continue
+            tile = (packed >> move_shift) & self.board.tile_mask
+            child = packed - (tile << move_shift) + (tile << zero_shift) + zero_delta
+            self.PATH.append(move)
+            child_bound = self.search(child, cost + 1, bound, zero_in)
+            self.PATH.pop()
+            if next_bound is None or child_bound < next_bound:
+                next_bound = child_bound
+        return next_bound
+
+
+class SearchSide:
+    # one direction of a bidirectional search: parent pointers towards its root, best known costs,
+    # open heap of (f, -g, packed) and the expanded states
+    def __init__(self, root: int, distance: ConflictDistance = None):
+        self.distance = distance
+        self.parents = {root: None}
+        self.costs = {root: 0}
+        self.frontier = [(distance.compute(root) if distance else 0, 0, root)]
+        self.closed = set()
+
+
+class BidirectionalEights(Eights):
+    # breadth-first search from both the input and the result state, one whole level of the smaller
+    # frontier at a time, until a generated state is already known to the other side;
+    # ITER counts expanded states of both sides
+    def compute(self):
+        if not self.is_solvable():
+            return
+        if self.is_result_state():
+            raise Done(self.board.unpack(self.PACKED), self.ITER)
+        forward = SearchSide(self.PACKED)
+        backward = SearchSide(self.RES_PACKED)
+        forward_frontier = [self.PACKED]
+        backward_frontier = [self.RES_PACKED]
+        while forward_frontier and backward_frontier:
+            if len(forward_frontier) <= len(backward_frontier):
+                forward_frontier, meeting = self.expand_level(forward_frontier, forward, backward)
+            else:
+                backward_frontier, meeting = self.expand_level(backward_frontier, backward, forward)
+            if meeting is not None:
+                self.PARENTS = forward.parents
+                self.PATH = self.splice_path(forward, backward, meeting)
+                self.PACKED = self.RES_PACKED
+                raise Done(self.board.unpack(self.PACKED), self.ITER)
+
+    def expand_level(self, frontier: list, side: SearchSide, other: SearchSide):
+        # returns the next level and the meeting state closest to the other root, if any
+        next_frontier = []
+        meeting = None
+        meeting_cost = None
+        for packed in frontier:
+            self.ITER += 1
+            cost = side.costs[packed] + 1
+            for move, child in self.available_children(packed):
+                if child in side.costs:
+                    continue
+                side.costs[child] = cost
+                side.parents[child] = packed
+                next_frontier.append(child)
+                # the whole level is finished first: states of this level may sit at different depths on the other side
+                if child in other.costs and (meeting is None or other.costs[child] < meeting_cost):
+                    meeting = child
+                    meeting_cost = other.costs[child]
+        return next_frontier, meeting
+
+    def splice_path(self, forward: SearchSide, backward: SearchSide, meeting: int):
+        # moves from the input to the meeting state, then the backward parent chain down to the result
+        path = self.rebuild_path(forward.parents, meeting)
+        packed = meeting
+        while backward.parents[packed] is not None:
+            packed = backward.parents[packed]
+            path.append(packed >> self.board.zero_shift)
+        return path
+
+
+class BidirectionalAStarEights(BidirectionalEights):
+    # A* from both ends, each side guided by ConflictDistance towards the opposite root;
+    # stops once the best path found is no longer than the smallest f left on either side
+    def compute(self):
+        if not self.is_solvable():
+            return
+        forward = SearchSide(self.PACKED, ConflictDistance(self.RES_STATE))
+        backward = SearchSide(self.RES_PACKED, ConflictDistance(self.INP_STATE))
+        best = None
+        meeting = self.PACKED if self.is_result_state() else None
+        if meeting is not None:
+            best = 0
+        while forward.frontier and backward.frontier:
+            # every f is a lower bound of the optimal cost, so nothing left open can beat `best`
+            if best is not None and best <= max(forward.frontier[0][0], backward.frontier[0][0]):
+                break
+            if len(forward.frontier) <= len(backward.frontier):
+                side, other = forward, backward
+            else:
+                side, other = backward, forward
+            _, cost, packed = heappop(side.frontier)
+            cost = -cost
+            if packed in side.closed:
+                continue
+            side.closed.add(packed)
+            self.ITER += 1
+            child_cost = cost + 1
+            for move, child in self.available_children(packed):
+                if child in side.closed or side.costs.get(child, child_cost + 1) <= child_cost:
+                    continue
+                side.costs[child] = child_cost
+                side.parents[child] = packed
+                heappush(side.frontier, (child_cost + side.distance.compute(child), -child_cost, child))
+                if child in other.costs and (best is None or child_cost + other.costs[child] < best):
+                    best = child_cost + other.costs[child]
+                    meeting = child
+        if meeting is None:
+            return
+        self.PARENTS = forward.parents
+        self.PATH = self.splice_path(forward, backward, meeting)
+        self.PACKED = self.RES_PACKED
+        raise Done(self.board.unpack(self.PACKED), self.ITER)
+
+
+class MappedTable:
+    # byte table cached in a file after a header naming its contents, memory-mapped on load();
+    # a missing, stale or foreign file is computed again, subclasses give path, size, header() and compute()
+    path: str
+    size: int
+    table: memoryview = None
+    file = None
+
+    def header(self) -> bytes:
+        raise NotImplementedError
+
+    def compute(self) -> bytearray:
+        raise NotImplementedError
+
+    def build(self):
+        table = self.compute()
+        with open(self.path, "wb") as f:
+            f.write(self.header())
+            f.write(table)
+
+    def load(self):
+        if self.table is not None:
+            return self
+        if not os.path.exists(self.path):
+            self.build()
+        self.file = open(self.path, "rb")
+        table = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = self.header()
+        if table[:len(header)] != header or len(table) != len(header) + self.size:
+            # stale or foreign file, rebuild it
+            table.close()
+            self.file.close()
+            self.build()
+            return self.load()
+        self.table = memoryview(table)[len(header):]
+        return self
+
+    def close(self):
+        if self.table is not None:
+            self.table.release()
+            self.table = None
+            self.file.close()
+
+
+class PatternDatabase(MappedTable):
+    # for every placement of the pattern tiles: how many moves of pattern tiles bring them to their goal cells,
+    # the other tiles are anonymous and moving them is free, so disjoint patterns add up admissibly;
+    # one byte per placement indexed by sum(cell of pattern[k] * cells ** k), cached on disk and memory-mapped
+    MAGIC = b"PDB1"
+    UNREACHED = 0xFF
+
+    def __init__(self, resulting_state: list, pattern: list, path: str = None):
+        self.board = Board.of_state(resulting_state)
+        self.resulting_state = resulting_state
+        self.pattern = pattern
+        self.weights = [self.board.cells ** k for k in range(len(pattern))]
+        self.size = self.board.cells ** len(pattern)
+        self.path = path or self.default_path()
+
+    def default_path(self) -> str:
+        name = f"pdb_{self.board.side}x{self.board.side}_{'-'.join(map(str, self.resulting_state))}" \
+               f"_{'-'.join(map(str, self.pattern))}.bin"
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+
+    def header(self) -> bytes:
+        return self.MAGIC + bytes([self.board.side, len(self.pattern)]) + bytes(self.resulting_state) \
+            + bytes(self.pattern)
+
+    def index(self, tiles: list) -> int:
+        # placement index of the pattern on a plain (unpacked) board
+        positions = [0] * self.board.cells
+        for cell, number in enumerate(tiles):
+            positions[number] = cell
+        return sum(positions[number] * weight for number, weight in zip(self.pattern, self.weights))
+
+    def compute(self) -> bytearray:
+        # 0-1 BFS from the goal over (placement, blank cell): moving a pattern tile costs 1, any other tile 0
+        board = self.board
+        cells = board.cells
+        goal_index, _ = board.goal_table(self.resulting_state)
+        costs = bytearray([self.UNREACHED]) * (self.size * cells)
+        table = bytearray([self.UNREACHED]) * self.size
+        start = sum(goal_index[number] * weight for number, weight in zip(self.pattern, self.weights)) * cells \
+            + goal_index[0]
+        costs[start] = 0
+        queue = deque([start])
+        while queue:
+            key = queue.popleft()
+            index, zero_in = divmod(key, cells)
+            cost = costs[key]
+            if table[index] == self.UNREACHED:
+                # 0-1 BFS pops in cost order, the first blank cell seen for a placement is its cheapest
+                table[index] = cost
+            positions = [(index // weight) % cells for weight in self.weights]
+            for move in board.possible_moves[zero_in]:
+                if move in positions:
+                    # pattern tile slides from `move` into the blank
+                    child = (index + (zero_in - move) * self.weights[positions.index(move)]) * cells + move
+                    if cost + 1 < costs[child]:
+                        costs[child] = cost + 1
+                        queue.append(child)
+                else:
+                    child = index * cells + move
+                    if cost < costs[child]:
+                        costs[child] = cost
+                        queue.appendleft(child)
+        return table
+
+
+class AdditivePatterns:
+    # sum of disjoint pattern databases, tiles are grouped by goal cell in row order, `group_size` tiles a group
+    GROUP_SIZES = {3: 4, 4: 5}
+
+    def __init__(self, resulting_state: list, group_size: int = None):
+        self.board = Board.of_state(resulting_state)
+        group_size = group_size or self.GROUP_SIZES.get(self.board.side, 4)
+        tiles = [number for number in resulting_state if number != 0]
+        self.databases = [
+            PatternDatabase(resulting_state, tiles[i:i + group_size]).load()
+            for i in range(0, len(tiles), group_size)
+        ]
+        # tile -> (database number, placement index weight of the tile)
+        self.slots = [None] * self.board.cells
+        for d, database in enumerate(self.databases):
+            for number, weight in zip(database.pattern, database.weights):
+                self.slots[number] = (d, weight)
+        self.tables = [database.table for database in self.databases]
+
+    def indexes(self, packed: int) -> list:
+        tiles = self.board.unpack(packed)
+        return [database.index(tiles) for database in self.databases]
+
+    def estimate(self, indexes: list) -> int:
+        return sum(table[index] for table, index in zip(self.tables, indexes))
+
+    def compute(self, packed: int) -> int:
+        return self.estimate(self.indexes(packed))
+
+
+class PatternEights(IDAStarEights):
+    # IDA* guided by additive pattern databases, placements are updated per move instead of recomputed,
+    # needed for 4x4 boards and beyond
+    def __init__(self, input_state: list, result_state: list, group_size: int = None):
+        super().__init__(input_state, result_state)
+        self.patterns = AdditivePatterns(result_state, group_size)
+        self.indexes = []
+        self.estimate = 0
+
+    def compute(self):
+        if not self.is_solvable():
+            return
+        self.indexes = self.patterns.indexes(self.PACKED)
+        self.estimate = self.patterns.estimate(self.indexes)
+        bound = self.estimate
+        while True:
+            self.PATH = []
+            bound = self.search(self.PACKED, 0, bound, -1)
+
+    def search(self, packed: int, cost: int, bound: int, came_from: int) -> int:
+        self.ITER += 1
+        if cost + self.estimate > bound:
+            return cost + self.estimate
+        if packed == self.RES_PACKED:
+            self.PACKED = packed
+            raise Done(self.board.unpack(packed), self.ITER)
+        next_bound = None
+        zero_in = packed >> self.board.zero_shift
+        indexes = self.indexes
+        for move, move_shift, zero_shift, zero_delta in self.SWAPS[zero_in]:
+            # never step the blank straight back
+            if move == came_from:
+                continue
+            tile = (packed >> move_shift) & self.board.tile_mask
+            child = packed - (tile << move_shift) + (tile << zero_shift) + zero_delta
+            # only the database of the moved tile changes
+            d, weight = self.patterns.slots[tile]
+            table = self.patterns.tables[d]
+            index = indexes[d]
+            estimate = self.estimate
+            indexes[d] = index + (zero_in - move) * weight
+            self.estimate = estimate - table[index] + table[indexes[d]]
+            self.PATH.append(move)
+            child_bound = self.search(child, cost + 1, bound, zero_in)
+            self.PATH.pop()
+            indexes[d] = index
+            self.estimate = estimate
+            if next_bound is None or child_bound < next_bound:
+                next_bound = child_bound
+        return next_bound
+
+
+class DistanceOracle(MappedTable):
+    # shortest distances to one goal for every board, one byte per permutation rank:
+    # bits 0-4 distance, bits 5-6 direction of the next blank move, UNREACHED for the other parity
+    MAGIC = b"8PZ1"
+    UNREACHED = 0xFF
+    DISTANCE_MASK = 0x1F
+    DIRECTIONS = [-3, 3, -1, 1]  # up, down, left, right
+    TABLE_SIZE = 362880  # 9!
+    size = TABLE_SIZE
+
+    def __init__(self, resulting_state: list, path: str = None):
+        if sorted(resulting_state) != list(range(9)):
+            raise ValueError("the distance oracle covers 3x3 boards of the tiles 0-8 only")
+        self.board = Board.of_size(3)
+        self.resulting_state = resulting_state
+        self.path = path or self.default_path(resulting_state)
+
+    @staticmethod
+    def default_path(resulting_state: list) -> str:
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), f"oracle_{Eights.to_str(resulting_state)}.bin")
+
+    def header(self) -> bytes:
+        return self.MAGIC + bytes(self.resulting_state)
+
+    def compute(self) -> bytearray:
+        # single BFS from the goal, every board learns its distance and the move back towards the goal
+        table = bytearray([self.UNREACHED]) * self.TABLE_SIZE
+        goal = self.board.pack(self.resulting_state)
+        table[rank_state(self.resulting_state)] = 0
+        seen = {goal}
+        frontier = [goal]
+        distance = 0
+        while frontier:
+            distance += 1
+            next_frontier = []
+            for packed in frontier:
+                zero_in = packed >> self.board.zero_shift
+                for move, move_shift, zero_shift, zero_delta in self.board.swaps[zero_in]:
+                    tile = (packed >> move_shift) & self.board.tile_mask
+                    child = packed - (tile << move_shift) + (tile << zero_shift) + zero_delta
+                    if child in seen:
+                        continue
+                    seen.add(child)
+                    # from the child the blank goes back from `move` to `zero_in`
+                    table[rank_state(self.board.unpack(child))] = distance | (self.DIRECTIONS.index(zero_in - move) << 5)
+                    next_frontier.append(child)
+            frontier = next_frontier
+        return table
+
+    @staticmethod
+    def check(state: list):
+        # any other list still has a rank, of some unrelated board
+        if sorted(state) != list(range(9)):
+            raise ValueError(f"{Eights.to_str(state)} is not a board of the tiles 0-8")
+
+    def distance(self, state: list):
+        self.check(state)
+        entry = self.load().table[rank_state(state)]
+        if entry == self.UNREACHED:
+            return None
+        return entry & self.DISTANCE_MASK
+
+    def solve(self, state: list):
+        # shortest path as the list of blank moves, None when the goal can not be reached
+        self.check(state)
+        table = self.load().table
+        entry = table[rank_state(state)]
+        if entry == self.UNREACHED:
+            return None
+        path = []
+        packed = self.board.pack(state)
+        while entry & self.DISTANCE_MASK:
+            move = (packed >> self.board.zero_shift) + self.DIRECTIONS[entry >> 5]
+            packed = self.board.move(packed, move)
+            path.append(move)
+            entry = table[rank_state(self.board.unpack(packed))]
+        return path
+
+
+def solve_many(oracle: DistanceOracle, boards):
+    # stream (board, path, error) for every board, a list of tiles or a string like 214687035;
+    # a bad board gets its error instead of a path and the rest of the stream goes on
+    oracle.load()
+    for board in boards:
+        try:
+            if isinstance(board, str) and not board.isdigit():
+                raise ValueError(f"{board} is not a board of the tiles 0-8")
+            state = Eights.to_list(board) if isinstance(board, str) else list(board)
+            yield board, oracle.solve(state), None
+        except ValueError as e:
+            yield board, None, str(e)
+
+
+class OracleEights(Eights):
+    # answers from a prebuilt DistanceOracle, ITER counts table lookups
+    ORACLES: dict = {}
+
+    def __init__(self, input_state: list, result_state: list, oracle: DistanceOracle = None):
+        super().__init__(input_state, result_state)
+        if oracle is None:
+            # one mapped table per goal for the whole process
+            oracle = self.ORACLES.setdefault(self.to_str(result_state), DistanceOracle(result_state))
+        # the table is mapped (or built) with the solver, not inside compute()
+        self.oracle = oracle.load()
+
+    def compute(self):
+        path = self.oracle.solve(self.INP_STATE)
+        if path is None:
+            return
+        self.PATH = path
+        self.ITER = len(path) + 1
+        self.PACKED = self.RES_PACKED
+        raise Done(self.board.unpack(self.PACKED), self.ITER)
+
+
+SOLVERS = {
+    'astar': AStarEights,
+    'idastar': IDAStarEights,
+    'pattern': PatternEights,
+    'bibfs': BidirectionalEights,
+    'biastar': BidirectionalAStarEights,
+    'oracle': OracleEights,
+}
+
+
+def random_run(input_state: list, result_state: list, seed: int = None):
+    # one randomized DFS with a vote of all heuristics, returns (iterations, path) or (None, None)
+    if seed is not None:
+        # RandomChoice draws from the module-level generator
+        random.seed(seed)
+    eights = Eights(
+        input_state=input_state,
+        result_state=result_state
+    )
+    eights.evristic_classes.append(RandomChoice)
+    eights.evristic_classes.append(LeftHand)
+    eights.evristic_classes.append(Manhattan)
+    eights.evristic_classes.append(ManhattanSingle)
+    eights.evristic_classes.append(ManhattanDescendants)
+
+    try:
+        eights.compute()
+    except Done as d:
+        return d.iterations, eights.PATH
+    return None, None
+
+
+def best_run(results, target: int = None):
+    # reduce (run, iterations, path) results to the best (iterations, path), stop early once `target`
+    # iterations is reached; stopping closes `results`, a pooled stream cancels its pending runs
+    best_result = None
+    best_path = None
+    try:
+        for i, iterations, path in results:
+            if iterations is None:
+                continue
+            if best_result is None or iterations < best_result:
+                best_result = iterations
+                best_path = path
+            print(f"Execution {i}: DONE!!!, Iterations: {iterations}")
+            if target is not None and best_result <= target:
+                break
+    finally:
+        results.close()
+    return best_result, best_path
+
+
+def random_restarts(input_state: list, result_state: list, runs: int = 1000, target: int = None, seed: int = 0):
+    # `runs` randomized DFS restarts one after another, seeded like stream_restarts,
+    # returns (iterations, path) of the best run
+    results = ((i, *random_run(input_state, result_state, seed + i)) for i in range(runs))
+    return best_run(results, target)
+
+
+def stream_restarts(input_state: list, result_state: list, runs: int = 1000, workers: int = None, seed: int = 0):
+    # fan restarts out over a process pool, run i is seeded with seed + i so every run is reproducible;
+    # yields (run, iterations, path) in completion order, closing the generator cancels pending runs
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {pool.submit(random_run, input_state, result_state, seed + i): i for i in range(runs)}
+        for future in as_completed(futures):
+            iterations, path = future.result()
+            yield futures[future], iterations, path
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def parallel_restarts(input_state: list, result_state: list, runs: int = 1000, workers: int = None,
+                      target: int = None, seed: int = 0):
+    # best (iterations, path) of the pooled restarts
+    return best_run(stream_restarts(input_state, result_state, runs, workers, seed), target)
+
+
+def solve(eights: Eights):
+    # single run of a constructed optimal solver, returns (expanded states, path) or (None, None) if unsolvable
+    try:
+        eights.compute()
+    except Done as d:
+        return d.iterations, eights.PATH
+    return None, None
+
+
+def parse_board(text: str) -> list:
+    # comma separated tiles of a square board, every number 0..N-1 exactly once
+    try:
+        tiles = list(map(int, text.split(",")))
+    except ValueError:
+        raise ValueError(f"{text} is not a list of comma separated tiles")
+    Board.of_state(tiles)
+    if sorted(tiles) != list(range(len(tiles))):
+        raise ValueError(f"{text} does not hold every tile 0-{len(tiles) - 1} exactly once")
+    return tiles
+
+
+def render_best_result(input_state, path, on_row=10):
+    # lazily yields the text lines of every state along `path`, `on_row` boards side by side,
+    # only one row of boards is kept in memory
+    side = Board.of_state(input_state).side
+    width = len(str(len(input_state) - 1))
+
+    def render_row(row):
+        yield " "
+        for line in range(side):
+            cells = [
+                " ".join(map(lambda n: " " * width if n == 0 else str(n).rjust(width), state[line * side:(line + 1) * side]))
+                for state in row
+            ]
+            yield "  |  ".join(cells)
+
     next_state = input_state.copy()
+    row = [next_state]
     for move in path:
         next_state = next_state.copy()
         zero_index = next_state.index(0)
         next_state[move], next_state[zero_index] = next_state[zero_index], next_state[move]
-        all_states.append(next_state)
-    # print(all_states)
-    rows = []
-    while len(all_states) > 0:
-        to_pop = on_row if len(all_states) >= on_row else len(all_states)
-        row = all_states[:to_pop]
-        all_states = all_states[to_pop:]
-        rows.append(row)
-
-    for row in rows:
-        print(" ")
-        line_1 = [" ".join(map(lambda n: " " if n == 0 else str(n), state[0:3])) for state in row]
-        line_2 = [" ".join(map(lambda n: " " if n == 0 else str(n), state[3:6])) for state in row]
-        line_3 = [" ".join(map(lambda n: " " if n == 0 else str(n), state[6:9])) for state in row]
-        print("  |  ".join(line_1))
-        print("  |  ".join(line_2))
-        print("  |  ".join(line_3))
+        row.append(next_state)
+        if len(row) == on_row:
+            yield from render_row(row)
+            row = []
+    if row:
+        yield from render_row(row)
+
+
+def print_best_result(input_state, path, on_row=10):
+    for line in render_best_result(input_state, path, on_row):
+        print(line)
 
 
 if __name__ == "__main__":
-    start_time = time.time()
-    tracemalloc.start()
+    parser = argparse.ArgumentParser(description="Solve the 8-puzzle (or any N×N sliding puzzle)")
+    parser.add_argument("--board", help="start board as comma separated tiles, 0 is the blank")
+    parser.add_argument("--goal", help="goal board as comma separated tiles, 0 is the blank")
+    parser.add_argument("--mode", choices=[*SOLVERS, 'random'], default='astar')
+    parser.add_argument("--runs", type=int, default=1000, help="restarts for the random mode")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes for the random mode restarts, 0 uses all cores")
+    parser.add_argument("--target", type=int, help="stop the random mode once a run needs at most this many iterations")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first random restart")
+    parser.add_argument("--batch", type=argparse.FileType("r"),
+                        help="stream boards (one per line, e.g. 214687035) through the oracle, '-' for stdin")
+    args = parser.parse_args()
+
+    if args.batch:
+        try:
+            oracle = DistanceOracle(parse_board(args.goal) if args.goal else [1, 2, 3, 8, 0, 4, 7, 6, 5])
+        except ValueError as e:
+            parser.error(f"--batch needs a 3x3 --goal: {e}")
+        boards = (line.strip() for line in args.batch if line.strip())
+        for board, path, error in solve_many(oracle, boards):
+            if error is not None:
+                print(f"{board} error: {error}")
+            else:
+                moves = "unsolvable" if path is None else f"{len(path)} {' '.join(map(str, path))}"
+                print(f"{board} {moves}")
+        sys.exit(0)
+
     input_state = [2, 1, 4, 6, 8, 7, 0, 3, 5]
     result_state = [1, 2, 3, 8, 0, 4, 7, 6, 5]
-    best_result = None
-    best_path = None
-    for i in range(1000):
-        # print(f"--- Execution {i} ---")
-        eights = Eights(
-            input_state=input_state,
-            result_state=result_state
-        )
-        eights.evristic_classes.append(RandomChoice)
-        eights.evristic_classes.append(LeftHand)
-        eights.evristic_classes.append(Manhattan)
-        eights.evristic_classes.append(ManhattanSingle)
-        eights.evristic_classes.append(ManhattanDescendants)
-
+    try:
+        if args.board:
+            input_state = parse_board(args.board)
+        if args.goal:
+            result_state = parse_board(args.goal)
+        elif args.board and len(input_state) != len(result_state):
+            # default goal of other sizes: tiles in order, blank last
+            result_state = list(range(1, len(input_state))) + [0]
+    except ValueError as e:
+        parser.error(str(e))
+    if len(input_state) != len(result_state):
+        parser.error(f"--board has {len(input_state)} tiles, --goal {len(result_state)}")
+    solver = None
+    if args.mode != 'random':
+        # distance tables and pattern databases are loaded (or built) before time and memory are measured
         try:
-            eights.compute()
-        except Done as d:
-            if best_result is None or d.iterations < best_result:
-                best_result = d.iterations
-                best_path = eights.PATH
-            # print(str(d))
-            print(f"Execution {i}: {str(d)}, Iterations: {d.iterations}")
+            solver = SOLVERS[args.mode](input_state=input_state, result_state=result_state)
+        except ValueError as e:
+            parser.error(f"--mode {args.mode}: {e}")
+    start_time = time.time()
+    tracemalloc.start()
+    if args.mode == 'random' and args.workers == 1:
+        best_result, best_path = random_restarts(input_state, result_state, args.runs, args.target, args.seed)
+    elif args.mode == 'random':
+        best_result, best_path = parallel_restarts(input_state, result_state, args.runs, args.workers or None,
+                                                   args.target, args.seed)
+    else:
+        best_result, best_path = solve(solver)
     print("--- Done ---")
     size, peak = tracemalloc.get_traced_memory()
     print(f"Best result: {best_result}")
+    if best_path is not None:
+        print(f"Path length: {len(best_path)}")
     # print(f"Best path: {best_path}")
     print(f"Used max memory: {peak} bytes")
     print(f"Execution time: {time.time() - start_time} sec")
-    print_best_result(input_state, best_path)
+    if best_path is not None:
+        print_best_result(input_state, best_path)
@@ -1,14 +1,27 @@
 import os
+import sys
+import time
 import random
+import fcntl
+import mmap
+from collections import deque
+from itertools import chain
 import click
-import redis
 import math
-from dotenv import load_dotenv
-from PIL import Image
+import struct
+import zipfile
+import json
+from contextlib import contextmanager, nullcontext
+import numpy as np
 
-load_dotenv()
-# connect to redis
-db = redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'), decode_responses=True)
+# the dataset cache is shared with the other labs
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dataset import ImageDataset, load_image
+
+# weights store, chosen by the numbers group and connected on first use (redis, pillow and dotenv
+# are imported only by the commands that need them)
+db = None
+store_name = 'redis'
 
 # define some static values
 DIGITS_W = 10
@@ -21,13 +34,63 @@ N_MAX = 30
 DEFINITION_ENOUGH = 0.95
 DEFINITION_LESS = 0.05
 
-KEY_PRIMAL_WEIGHTS = f"{os.getenv('REDIS_KEY')}:inner_weights"
-KEY_CLASS_WEIGHTS = f"{os.getenv('REDIS_KEY')}:outer_weights"
+KEY_PRIMAL_WEIGHTS = 'inner_weights'
+KEY_CLASS_WEIGHTS = 'outer_weights'
 
 PRIMAL_NEURONS_COUNT = int(math.ceil(DIGITS_SQUARE / 10 * 5))
 CLASS_NEURONS_COUNT = len(CLASSES)
 
 
+class Stats:
+    # per-phase timers, counters and events written as JSON lines to `output`;
+    # until enable() every call returns right away
+    NO_PHASE = nullcontext()
+
+    def __init__(self) -> None:
+        self.output = None
+        self.phases = dict()
+        self.counters = dict()
+
+    def enable(self, output) -> None:
+        self.output = output
+
+    def phase(self, name: str):
+        # phases may nest (store inside forward with the redis backend), every one counts its whole time
+        if self.output is None:
+            return self.NO_PHASE
+        return self.timed(name)
+
+    @contextmanager
+    def timed(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds, calls = self.phases.get(name, (0.0, 0))
+            self.phases[name] = (seconds + time.perf_counter() - start_time, calls + 1)
+
+    def count(self, name: str, value: int = 1) -> None:
+        if self.output is not None:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def event(self, name: str, **fields) -> None:
+        if self.output is not None:
+            self.output.write(json.dumps({'event': name, **fields}) + "\n")
+
+    def close(self) -> None:
+        if self.output is None:
+            return
+        phases = {name: {'seconds': round(seconds, 6), 'calls': calls} for name, (seconds, calls) in self.phases.items()}
+        self.event('summary', phases=phases, counters=self.counters)
+        self.output.flush()
+        self.output = None
+        self.phases = dict()
+        self.counters = dict()
+
+
+stats = Stats()
+
+
 def empty_list(size: int, initial: float = 0) -> list:
     return [initial for _ in range(size)]
 
@@ -42,96 +105,386 @@ def expected_learn_definitions(result: str) -> list[float]:
     return definitions
 
 
+def sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-x))
+
+
+def random_weights(n: int, m: int, range_start: float = -0.3, range_end: float = 0.3) -> np.ndarray:
+    weights = np.empty((n, m))
+    for i in range(n):
+        for j in range(m):
+            weights[i, j] = round(random.uniform(range_start, range_end), 3)
+    return weights
+
+
 def load_image_matrix(image_path: str) -> tuple[int, list]:
-    with Image.open(image_path) as im:
-        # resize to 10x10
-        if im.size != (DIGITS_W, DIGITS_H):
-            im = im.resize((DIGITS_W, DIGITS_H))
-        # convert images to a greyscale:
-        # https://pillow.readthedocs.io/en/latest/handbook/concepts.html#concept-modes
-        # im = im.convert('L')
-        im = im.convert('1', colors=2)
-        # normalize data
-        # picture_data = list(im.getdata())
-        # n_min = min(*picture_data)
-        # n_max = max(*picture_data)
-        # normalized_data = [(x - n_min) / (n_max - n_min) for x in picture_data]
-        normalized_data = list(map(lambda p: -1 if p == 255 else 1, list(im.getdata())))
-        return hash(tuple(normalized_data)), normalized_data
-
-
-class RedisMatrix:
-    def __init__(self, key: str, n: int, m: int) -> None:
-        self.key = key
+    stats.count('images_decoded')
+    with stats.phase('load'):
+        normalized_data = load_image(image_path, DIGITS_W, DIGITS_H).tolist()
+    return hash(tuple(normalized_data)), normalized_data
+
+
+def load_dataset(directory: str, holdout: int = 0) -> tuple[tuple, tuple]:
+    # images named <label>-<number>.gif, the last `holdout` images of every label are kept for testing;
+    # returns (inputs, expected) arrays of the learn and the test images
+    with stats.phase('load'):
+        images = ImageDataset(directory, DIGITS_W, DIGITS_H).load()
+    by_label = dict()
+    for row, label in enumerate(images.labels):
+        if label in CLASSES:
+            by_label.setdefault(label, []).append(row)
+    learn_rows, test_rows = [], []
+    for label, rows in by_label.items():
+        split = len(rows) - holdout
+        learn_rows += rows[:split]
+        test_rows += rows[split:]
+    return dataset_arrays(images, learn_rows), dataset_arrays(images, test_rows)
+
+
+def dataset_arrays(images: ImageDataset, rows: list[int]) -> tuple[np.ndarray, np.ndarray]:
+    # inputs (images x pixels) and expected definitions (images x classes)
+    inputs = np.asarray(images.vectors[rows], dtype=float)
+    expected = np.array([expected_learn_definitions(images.labels[row]) for row in rows])
+    return inputs.reshape(len(rows), DIGITS_SQUARE), expected.reshape(len(rows), CLASS_NEURONS_COUNT)
+
+
+class StorePipeline:
+    # queued writes run by execute(), redis pipelines for the stores without them;
+    # reads go to the store right away like the reads of a watching redis pipeline
+    def __init__(self, store) -> None:
+        self.store = store
+        self.calls = []
+
+    def mget(self, keys: list[str]) -> list:
+        return self.store.mget(keys)
+
+    def multi(self) -> None:
+        pass
+
+    def set(self, *args):
+        self.calls.append((self.store.set, args))
+
+    def incr(self, *args):
+        self.calls.append((self.store.incr, args))
+
+    def delete(self, *args):
+        self.calls.append((self.store.delete, args))
+
+    def execute(self) -> list:
+        return [call(*args) for call, args in self.calls]
+
+
+class MemoryStore:
+    # the subset of redis commands used by StoredMatrix, kept in a dict of the process
+    def __init__(self) -> None:
+        self.data = dict()
+
+    def get(self, key: str) -> bytes | None:
+        value = self.data.get(key)
+        return None if value is None else bytes(value)
+
+    def mget(self, keys: list[str]) -> list:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: bytes) -> bool:
+        self.data[key] = bytearray(value)
+        return True
+
+    def incr(self, key: str) -> int:
+        value = int(self.data.get(key, b'0')) + 1
+        self.data[key] = bytearray(str(value).encode())
+        return value
+
+    def delete(self, *keys: str) -> int:
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def pipeline(self) -> StorePipeline:
+        return StorePipeline(self)
+
+    def transaction(self, func, *watches) -> list:
+        # redis Redis.transaction(): func reads, calls pipe.multi() and queues the writes;
+        # nothing else writes to the dict of this process in between
+        pipe = self.pipeline()
+        func(pipe)
+        return pipe.execute()
+
+
+class FileStore(MemoryStore):
+    # every key is a file in `path`: reads go through a memory map of the file, set() swaps in a new file
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self.maps = dict()
+        os.makedirs(path, exist_ok=True)
+
+    def file(self, key: str) -> str:
+        return os.path.join(self.path, key.replace(os.sep, '_'))
+
+    def mapped(self, key: str):
+        try:
+            stat = os.stat(self.file(key))
+        except FileNotFoundError:
+            return None
+        if stat.st_size == 0:
+            return b''
+        # a replaced file is mapped again
+        found = self.maps.get(key)
+        if found is None or found[0] != (stat.st_ino, stat.st_size):
+            with open(self.file(key), 'rb') as f:
+                found = (stat.st_ino, stat.st_size), mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[key] = found
+        return found[1]
+
+    def get(self, key: str) -> bytes | None:
+        data = self.mapped(key)
+        return None if data is None else data[:]
+
+    def set(self, key: str, value: bytes) -> bool:
+        with open(self.file(key) + ".tmp", 'wb') as f:
+            f.write(value)
+        os.replace(self.file(key) + ".tmp", self.file(key))
+        return True
+
+    def incr(self, key: str) -> int:
+        # runs under the lock of transaction(); the counter is swapped in like any other key,
+        # rewriting it in place would crash the processes that have it mapped
+        value = int(self.get(key) or 0) + 1
+        self.set(key, str(value).encode())
+        return value
+
+    def transaction(self, func, *watches) -> list:
+        # other processes wait on the lock of the store directory instead of watching the keys
+        with open(os.path.join(self.path, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            return super().transaction(func, *watches)
+
+    def delete(self, *keys: str) -> int:
+        deleted = 0
+        for key in keys:
+            if os.path.exists(self.file(key)):
+                os.remove(self.file(key))
+                deleted += 1
+        return deleted
+
+
+def redis_store():
+    import redis
+    return redis.Redis(host=os.getenv('REDIS_HOST'), port=os.getenv('REDIS_PORT'))
+
+
+STORES = {
+    # name -> factory of a store with the redis commands StoredMatrix uses
+    'redis': redis_store,
+    'file': lambda: FileStore(os.getenv('NEURON_STORE_PATH', '.neuron_store')),
+    'memory': MemoryStore,
+}
+# stores of the numbers commands, the memory store starts empty in every process and is for library use
+CLI_STORES = ['redis', 'file']
+
+
+def use_store(name: str) -> None:
+    global db, store_name
+    if name != store_name:
+        db = None
+        store_name = name
+
+
+def connect():
+    global db
+    if db is None:
+        db = STORES[store_name]()
+    return db
+
+
+def store_key(name: str) -> str:
+    return f"{os.getenv('REDIS_KEY', 'neuron')}:{name}"
+
+
+class StoredMatrix:
+    # the whole matrix is a single string of the store: header (magic, dtype, shape, version) + packed weights;
+    # the version comes from the `{key}:version` counter and grows with every save
+    HEADER = struct.Struct('<4s4sIII')
+    MAGIC = b'NMX1'
+    DTYPE = np.dtype('<f4')
+
+    def __init__(self, name: str, n: int, m: int) -> None:
+        self.key = store_key(name)
+        self.version_key = f"{self.key}:version"
         self.n = n
         self.m = m
+        self.version = 0
 
-    def get(self, i: int, j: int) -> float:
-        res = db.lrange(f"{self.key}:{i}", j, j)
-        if len(res) > 0:
-            return float(res[0])
-        raise KeyError(f"No such element [{i}][{j}]")
+    def pack(self, weights: np.ndarray, version: int) -> bytes:
+        header = self.HEADER.pack(self.MAGIC, self.DTYPE.str.encode(), self.n, self.m, version)
+        return header + np.ascontiguousarray(weights, self.DTYPE).tobytes()
 
-    def set(self, i: int, j: int, val: float):
-        if i >= self.n or j >= self.m:
-            raise IndexError(f"No such element [{i}][{j}]")
-        db.lset(f"{self.key}:{i}", j, str(val))
+    def unpack(self, blob: bytes) -> np.ndarray:
+        magic, dtype, n, m, version = self.HEADER.unpack_from(blob)
+        if magic != self.MAGIC or dtype.rstrip(b'\0') != self.DTYPE.str.encode() or (n, m) != (self.n, self.m):
+            raise KeyError(f"Matrix {self.key} has unexpected format, run init")
+        self.version = version
+        return np.frombuffer(blob, self.DTYPE, offset=self.HEADER.size).reshape(n, m).astype(float)
 
     def create(self) -> None:
-        for i in range(self.n):
-            db.lpush(f"{self.key}:{i}", *empty_list(self.m))
+        self.save(np.zeros((self.n, self.m)))
+
+    def clean(self, pipe=None):
+        # blob and the per-row lists of the old layout in one DEL
+        stats.count('store_ops')
+        (pipe or connect()).delete(self.key, *[f"{self.key}:{i}" for i in range(self.n)])
+
+    def load(self) -> np.ndarray:
+        # whole matrix in one GET
+        stats.count('store_ops')
+        with stats.phase('store'):
+            blob = connect().get(self.key)
+        if blob is None:
+            raise KeyError(f"Matrix {self.key} is not initialized")
+        return self.unpack(blob)
 
-    def clean(self):
-        for key in db.scan_iter(f"{self.key}:*"):
-            db.delete(key)
+    def save(self, weights: np.ndarray) -> None:
+        # whole matrix in one SET
+        save_matrices([(self, weights)])
+
+    @property
+    def weights(self) -> np.ndarray:
+        return self.load()
+
+    @weights.setter
+    def weights(self, weights: np.ndarray) -> None:
+        self.save(weights)
+
+    def flush(self) -> None:
+        # every change is already stored
+        pass
 
     def print_matrix(self) -> None:
-        for i in range(self.n):
-            line = list(map(float, db.lrange(f"{self.key}:{i}", 0, self.m - 1)))
-            click.echo(line)
+        for line in self.load():
+            click.echo(line.tolist())
+
+
+def save_matrices(saves: list[tuple[StoredMatrix, np.ndarray]], clean: bool = False) -> None:
+    # blobs and their version bumps in one MULTI/EXEC, `clean` deletes the old keys first; the versions are
+    # read under WATCH, a concurrent save makes the store run the transaction again with the new versions
+    matrices = [matrix for matrix, _ in saves]
+    versions = []
+
+    def queue(pipe) -> None:
+        versions[:] = [int(v or 0) + 1 for v in pipe.mget([matrix.version_key for matrix in matrices])]
+        pipe.multi()
+        for (matrix, weights), version in zip(saves, versions):
+            if clean:
+                matrix.clean(pipe)
+            pipe.incr(matrix.version_key)
+            pipe.set(matrix.key, matrix.pack(weights, version))
+
+    # WATCH, GET of the versions and the MULTI/EXEC
+    stats.count('store_ops', 3)
+    with stats.phase('store'):
+        connect().transaction(queue, *[matrix.version_key for matrix in matrices])
+    for matrix, version in zip(matrices, versions):
+        matrix.version = version
+
+
+class ArrayMatrix:
+    # weights of a stored matrix kept in memory as a numpy array:
+    # loaded from the store once, written back by flush()
+    def __init__(self, store: StoredMatrix) -> None:
+        self.store = store
+        self.key = store.key
+        self.version_key = store.version_key
+        self.n = store.n
+        self.m = store.m
+        self.weights = store.load()
+        self.version = store.version
+
+    def flush(self) -> None:
+        self.store.save(self.weights)
+
+
+class MemoryMatrix:
+    # weights that live only in memory, nothing to store
+    def __init__(self, key: str, weights: np.ndarray) -> None:
+        self.key = key
+        self.n, self.m = weights.shape
+        self.weights = weights
 
+    def flush(self) -> None:
+        pass
 
-class Neuron(RedisMatrix):
 
-    expected_output: list[float]
-    inputs: list[float]
-    weighted: list[float]
-    outputs: list[float]
+MATRIX_BACKENDS = {
+    # name -> matrix factory on top of a stored matrix
+    'array': ArrayMatrix,
+    'store': lambda store: store,
+}
 
-    def init_weights(self, range_start: float = -0.3, range_end: float = 0.3):
-        for i in range(self.n):
-            for j in range(self.m):
-                w = round(random.uniform(range_start, range_end), 3)
-                db.lset(f"{self.key}:{i}", j, str(w))
+
+class Neuron:
+    # inputs may be a single vector (n,) or a batch of vectors (batch, n)
+
+    matrix: StoredMatrix | ArrayMatrix | MemoryMatrix
+    expected_output: np.ndarray
+    inputs: np.ndarray
+    weighted: np.ndarray
+    outputs: np.ndarray
+
+    def __init__(self, matrix: StoredMatrix | ArrayMatrix | MemoryMatrix) -> None:
+        self.matrix = matrix
+        self.key = matrix.key
+        self.n = matrix.n
+        self.m = matrix.m
+
+    def flush(self) -> None:
+        self.matrix.flush()
 
     def compute_weighted(self):
-        self.weighted = empty_list(self.m)
-        for i in range(self.n):
-            for j in range(self.m):
-                self.weighted[j] += self.get(i, j) * self.inputs[i]
+        self.weighted = self.inputs @ self.matrix.weights
 
     def compute_outputs(self):
         self.compute_weighted()
-        self.outputs = empty_list(self.m)
-        for j in range(self.m):
-            self.outputs[j] = 1/(1 + math.exp(-self.weighted[j]))
+        self.outputs = sigmoid(self.weighted)
+
+    def gradient(self, delta: np.ndarray) -> np.ndarray:
+        # gradient of every weight is input[i] * delta[j], summed over the batch
+        return np.atleast_2d(self.inputs).T @ np.atleast_2d(delta)
+
+    def update_weights(self, delta: np.ndarray):
+        self.matrix.weights = self.matrix.weights - WEIGHT_STEP * self.gradient(delta)
 
 
 class OuterNeuron(Neuron):
+    delta: np.ndarray
+
     def compute_weights(self):
-        for j in range(self.n):
-            for k in range(self.m):
-                new_weight = self.get(j, k) - (WEIGHT_STEP * self.inputs[j] * self.outputs[k] * (self.outputs[k] - self.expected_output[k]) * (1 - self.outputs[k]))
-                self.set(j, k, new_weight)
+        self.delta = self.outputs * (self.outputs - self.expected_output) * (1 - self.outputs)
+        self.update_weights(self.delta)
 
 
 class InnerNeuron(Neuron):
     def compute_weights(self, outer_neuron: OuterNeuron):
-        for i in range(self.n):
-            for j in range(self.m):
-                outer_sigma = sum([outer_neuron.get(j, p) * outer_neuron.outputs[p] * (outer_neuron.outputs[p] - self.expected_output[p]) * (1 - outer_neuron.outputs[p]) for p in range(outer_neuron.m)])
-                new_weight = self.get(i, j) - (WEIGHT_STEP * self.inputs[i] * self.outputs[j] * (1 - self.outputs[j]) * outer_sigma)
-                self.set(i, j, new_weight)
+        # back-propagated through the already updated outer weights, once per hidden neuron
+        outer_sigma = outer_neuron.delta @ outer_neuron.matrix.weights.T
+        self.update_weights(self.outputs * (1 - self.outputs) * outer_sigma)
+
+
+def elementwise_step(inner_weights: np.ndarray, outer_weights: np.ndarray,
+                     input_data: list[float], expected_output: list[float]) -> tuple[np.ndarray, np.ndarray]:
+    # one learn iteration with the per-element formulas, reference for the check command
+    inner_weights = inner_weights.copy()
+    outer_weights = outer_weights.copy()
+    n, m = inner_weights.shape
+    p_count = outer_weights.shape[1]
+    hidden = [1 / (1 + math.exp(-sum(inner_weights[i, j] * input_data[i] for i in range(n)))) for j in range(m)]
+    outputs = [1 / (1 + math.exp(-sum(outer_weights[j, k] * hidden[j] for j in range(m)))) for k in range(p_count)]
+    for j in range(m):
+        for k in range(p_count):
+            outer_weights[j, k] -= WEIGHT_STEP * hidden[j] * outputs[k] * (outputs[k] - expected_output[k]) * (1 - outputs[k])
+    for i in range(n):
+        for j in range(m):
+            outer_sigma = sum([outer_weights[j, p] * outputs[p] * (outputs[p] - expected_output[p]) * (1 - outputs[p]) for p in range(p_count)])
+            inner_weights[i, j] -= WEIGHT_STEP * input_data[i] * hidden[j] * (1 - hidden[j]) * outer_sigma
+    return inner_weights, outer_weights
 
 
 class NeuralNetwork:
@@ -142,24 +495,134 @@ class NeuralNetwork:
         self.inner_neuron = inner_neuron
         self.outer_neuron = outer_neuron
 
-    def learn(self, input_data: list[float], expected_output: list[float]) -> None:
+    def learn(self, input_data: list[float], expected_output: list[float], checkpoint: int = 0) -> None:
         # check result
         computed_result = self.result(input_data)
         print(f"Computed initial result: {[round(x, 2) for x in computed_result]}")
         iteration_number = 0
+        start_time = time.perf_counter()
         while not self.result_ok(computed_result, expected_output):
-            iteration_number += 1
-            if iteration_number > N_MAX:
+            if iteration_number == N_MAX:
+                stats.count('n_max_hits')
                 break
+            iteration_number += 1
+            self.backward(expected_output)
+            # re-compute result with new weights
+            computed_result = self.result(input_data)
+            print(f"Iteration: {iteration_number} result: {[round(x, 2) for x in computed_result]}")
+            if checkpoint and iteration_number % checkpoint == 0:
+                self.flush()
+        stats.count('samples')
+        stats.count('iterations', iteration_number)
+        stats.event('sample', iterations=iteration_number, converged=self.result_ok(computed_result, expected_output),
+                    seconds=time.perf_counter() - start_time)
+
+    def backward(self, expected_output) -> None:
+        # expected output of the last result(), a vector or a batch
+        with stats.phase('backward'):
             # recompute outer neuron weights
-            self.outer_neuron.expected_output = expected_output
+            self.outer_neuron.expected_output = np.asarray(expected_output)
             self.outer_neuron.compute_weights()
             # recompute inner neuron weights
-            self.inner_neuron.expected_output = expected_output
             self.inner_neuron.compute_weights(self.outer_neuron)
-            # re-compute result with new weights
-            computed_result = self.result(input_data)
-            print(f"Iteration: {iteration_number} result: {[round(x, 2) for x in computed_result]}")
+
+    def train(self, inputs: np.ndarray, expected: np.ndarray, epochs: int, batch_size: int = 1,
+              checkpoint: int = 0, rng: random.Random = random) -> None:
+        order = list(range(len(inputs)))
+        for epoch in range(1, epochs + 1):
+            start_time = time.perf_counter()
+            rng.shuffle(order)
+            correct = 0
+            error = 0.0
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                outputs = np.array(self.result(inputs[batch]))
+                correct += int((outputs.argmax(axis=1) == expected[batch].argmax(axis=1)).sum())
+                error += float(((outputs - expected[batch]) ** 2).sum())
+                self.backward(expected[batch])
+            print(f"Epoch: {epoch} error: {round(error / len(order), 4)} learned: {correct}/{len(order)}")
+            stats.event('epoch', epoch=epoch, error=error / len(order), learned=correct,
+                        seconds=time.perf_counter() - start_time)
+            if checkpoint and epoch % checkpoint == 0:
+                self.flush()
+
+    def gradients(self, expected_output) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # (inner gradient, outer gradient, correction) of the last result(), nothing is updated; the inner gradient
+        # goes through the outer weights of the forward pass, apply() moves it onto the updated ones like backward();
+        # all three are sums over the batch, so the parts of the shards of a batch add up
+        outputs = self.outer_neuron.outputs
+        outer_delta = outputs * (outputs - expected_output) * (1 - outputs)
+        hidden = self.inner_neuron.outputs
+        slope = hidden * (1 - hidden)
+        inner_delta = slope * (outer_delta @ self.outer_neuron.matrix.weights.T)
+        # correction[i, j, k] is input[i] * slope[j] * outer_delta[k] summed over the batch
+        inputs, slope, outer_delta = np.atleast_2d(self.inner_neuron.inputs, slope, outer_delta)
+        pairs = (slope[:, :, None] * outer_delta[:, None, :]).reshape(len(slope), -1)
+        correction = (inputs.T @ pairs).reshape(inputs.shape[1], slope.shape[1], outer_delta.shape[1])
+        return self.inner_neuron.gradient(inner_delta), self.outer_neuron.gradient(outer_delta), correction
+
+    def apply(self, inner_gradient: np.ndarray, outer_gradient: np.ndarray, correction: np.ndarray) -> None:
+        # the step of backward(): outer weights first, then the inner ones back-propagated through the updated
+        # outer weights; W - WEIGHT_STEP * G in place of W takes WEIGHT_STEP * sum_k correction[i, j, k] * G[j, k]
+        # off the inner gradient
+        outer_matrix = self.outer_neuron.matrix
+        inner_matrix = self.inner_neuron.matrix
+        outer_matrix.weights = outer_matrix.weights - WEIGHT_STEP * outer_gradient
+        inner_gradient = inner_gradient - WEIGHT_STEP * np.einsum('ijk,jk->ij', correction, outer_gradient)
+        inner_matrix.weights = inner_matrix.weights - WEIGHT_STEP * inner_gradient
+
+    def train_parallel(self, inputs: np.ndarray, expected: np.ndarray, epochs: int, batch_size: int,
+                       workers: int, staleness: int = 0, checkpoint: int = 0, rng: random.Random = random) -> None:
+        # every batch is split into `workers` shards, the shard gradients are summed in shard order and applied
+        # at once; a batch may be computed on weights missing the last `staleness` updates, 0 is fully synchronous
+        inner_matrix = self.inner_neuron.matrix
+        outer_matrix = self.outer_neuron.matrix
+        from concurrent.futures import ProcessPoolExecutor
+        order = list(range(len(inputs)))
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_shard_worker, initargs=(inputs, expected))
+        try:
+            for epoch in range(1, epochs + 1):
+                start_time = time.perf_counter()
+                rng.shuffle(order)
+                correct = 0
+                error = 0.0
+                pending = deque()
+                for start in range(0, len(order), batch_size):
+                    batch = order[start:start + batch_size]
+                    shards = [batch[i::workers] for i in range(min(workers, len(batch)))]
+                    pending.append([pool.submit(shard_gradients, inner_matrix.weights, outer_matrix.weights, shard)
+                                    for shard in shards])
+                    while len(pending) > staleness or (pending and start + batch_size >= len(order)):
+                        inner_gradient = 0
+                        outer_gradient = 0
+                        correction = 0
+                        for future in pending.popleft():
+                            with stats.phase('workers'):
+                                shard_inner, shard_outer, shard_correction, shard_correct, shard_error = future.result()
+                            # counted here, the counters of the worker processes are never reported
+                            stats.count('gradients')
+                            inner_gradient = inner_gradient + shard_inner
+                            outer_gradient = outer_gradient + shard_outer
+                            correction = correction + shard_correction
+                            correct += shard_correct
+                            error += shard_error
+                        self.apply(inner_gradient, outer_gradient, correction)
+                print(f"Epoch: {epoch} error: {round(error / len(order), 4)} learned: {correct}/{len(order)}")
+                stats.event('epoch', epoch=epoch, error=error / len(order), learned=correct,
+                            seconds=time.perf_counter() - start_time)
+                if checkpoint and epoch % checkpoint == 0:
+                    self.flush()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def accuracy(self, inputs: np.ndarray, expected: np.ndarray) -> int:
+        # count of correctly classified inputs
+        outputs = np.array(self.result(inputs))
+        return int((outputs.argmax(axis=1) == expected.argmax(axis=1)).sum())
+
+    def flush(self) -> None:
+        self.inner_neuron.flush()
+        self.outer_neuron.flush()
 
     def result_ok(self, result: list[float], expected_output: list[float]) -> bool:
         # find index of searched definition
@@ -178,17 +641,157 @@ class NeuralNetwork:
         return False
 
     def result(self, input_data: list[float]) -> list[float]:
-        self.inner_neuron.inputs = input_data
-        self.inner_neuron.compute_outputs()
-        self.outer_neuron.inputs = self.inner_neuron.outputs
-        self.outer_neuron.compute_outputs()
-        return self.outer_neuron.outputs
+        with stats.phase('forward'):
+            self.inner_neuron.inputs = np.asarray(input_data, dtype=float)
+            self.inner_neuron.compute_outputs()
+            self.outer_neuron.inputs = self.inner_neuron.outputs
+            self.outer_neuron.compute_outputs()
+            return self.outer_neuron.outputs.tolist()
+
+
+# dataset of a training worker process, sent once by the pool initializer
+shard_inputs: np.ndarray
+shard_expected: np.ndarray
+
+
+def init_shard_worker(inputs: np.ndarray, expected: np.ndarray) -> None:
+    global shard_inputs, shard_expected
+    shard_inputs = inputs
+    shard_expected = expected
+
+
+def shard_gradients(inner_weights: np.ndarray, outer_weights: np.ndarray, rows: list[int]):
+    # (inner gradient, outer gradient, correction, correctly classified, squared error) of the dataset rows
+    neural_net = NeuralNetwork(InnerNeuron(MemoryMatrix('inner', inner_weights)),
+                               OuterNeuron(MemoryMatrix('outer', outer_weights)))
+    outputs = np.array(neural_net.result(shard_inputs[rows]))
+    expected = shard_expected[rows]
+    correct = int((outputs.argmax(axis=1) == expected.argmax(axis=1)).sum())
+    error = float(((outputs - expected) ** 2).sum())
+    return *neural_net.gradients(expected), correct, error
+
+
+class QuantizedNetwork:
+    # inference only copy of the network: int8 weights with a float32 scale per column, integer sums over
+    # the ±1 pixels and sigmoids read from integer lookup tables; nothing else stays in memory, the float32
+    # copies the batch sums go through are made per call
+    SIGMOID_RANGE = 8.0
+    SIGMOID_STEPS = 64
+    HIDDEN_LEVELS = 255
+    OUTPUT_LEVELS = 65535
+
+    def __init__(self, inner_weights: np.ndarray, inner_scale: np.ndarray,
+                 outer_weights: np.ndarray, outer_scale: np.ndarray) -> None:
+        self.inner_weights = inner_weights
+        self.inner_scale = inner_scale.astype(np.float32)
+        self.outer_weights = outer_weights
+        self.outer_scale = outer_scale.astype(np.float32)
+        # sigmoid of -SIGMOID_RANGE..SIGMOID_RANGE in 1/SIGMOID_STEPS steps, as 0..HIDDEN_LEVELS for the hidden
+        # layer and 0..OUTPUT_LEVELS for the outputs
+        table = sigmoid(np.arange(-self.SIGMOID_RANGE * self.SIGMOID_STEPS, self.SIGMOID_RANGE * self.SIGMOID_STEPS + 1)
+                        / self.SIGMOID_STEPS)
+        self.hidden_table = np.rint(table * self.HIDDEN_LEVELS).astype(np.uint8)
+        self.output_table = np.rint(table * self.OUTPUT_LEVELS).astype(np.uint16)
+        # sum of every column, a ±1 image sums to twice its black pixels rows minus this
+        self.inner_sums = inner_weights.sum(axis=0, dtype=np.int32)
+        # integer sum to table step factor of every column
+        self.inner_steps = self.inner_scale * self.SIGMOID_STEPS
+        self.outer_steps = self.outer_scale / self.HIDDEN_LEVELS * self.SIGMOID_STEPS
+
+    @property
+    def nbytes(self) -> int:
+        # memory the model keeps between calls
+        return sum(array.nbytes for array in [self.inner_weights, self.inner_scale, self.outer_weights,
+                                              self.outer_scale, self.hidden_table, self.output_table, self.inner_sums,
+                                              self.inner_steps, self.outer_steps])
+
+    @staticmethod
+    def quantize(weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        scale = np.abs(weights).max(axis=0) / 127
+        scale[scale == 0] = 1
+        return np.rint(weights / scale).astype(np.int8), scale
+
+    @classmethod
+    def from_network(cls, neural_net: NeuralNetwork) -> 'QuantizedNetwork':
+        return cls(*cls.quantize(neural_net.inner_neuron.matrix.weights),
+                   *cls.quantize(neural_net.outer_neuron.matrix.weights))
+
+    @classmethod
+    def load(cls, path: str) -> 'QuantizedNetwork':
+        with np.load(path) as model:
+            return cls(model['inner_weights'], model['inner_scale'], model['outer_weights'], model['outer_scale'])
+
+    def save(self, path: str) -> None:
+        np.savez(path, inner_weights=self.inner_weights, inner_scale=self.inner_scale,
+                 outer_weights=self.outer_weights, outer_scale=self.outer_scale)
+
+    def lookup(self, sums: np.ndarray, steps: np.ndarray) -> np.ndarray:
+        # lookup table index of every integer sum, rounded to the nearest step; works in place of `sums`
+        sums *= steps
+        sums += self.SIGMOID_RANGE * self.SIGMOID_STEPS + 0.5
+        # maximum/minimum rather than np.clip, whose call overhead dominates a single image
+        np.maximum(sums, 0, out=sums)
+        np.minimum(sums, len(self.output_table) - 1, out=sums)
+        return sums.astype(np.intp)
+
+    def result(self, input_data) -> list:
+        with stats.phase('forward'):
+            # the integer sums are done in float32 to go through BLAS, they stay exact below 2**24
+            # (100 pixels * 127 and 50 hidden * 255 * 127 are far below)
+            pixels = np.asarray(input_data, dtype=np.float32)
+            if pixels.ndim == 1:
+                # a single image (serve) adds up the int8 rows of its black pixels, no matrix is cast
+                sums = (2 * self.inner_weights[pixels > 0].sum(axis=0, dtype=np.int32) - self.inner_sums)
+                hidden = self.hidden_table[self.lookup(sums.astype(np.float32), self.inner_steps)]
+                sums = (hidden.astype(np.int32) @ self.outer_weights).astype(np.float32)
+            else:
+                sums = pixels @ self.inner_weights.astype(np.float32)
+                hidden = self.hidden_table[self.lookup(sums, self.inner_steps)]
+                # hidden outputs as 0..HIDDEN_LEVELS integers
+                sums = hidden.astype(np.float32) @ self.outer_weights.astype(np.float32)
+            outputs = self.output_table[self.lookup(sums, self.outer_steps)]
+            return (outputs / self.OUTPUT_LEVELS).tolist()
+
+
+def format_result(outputs: list[float]) -> str:
+    combined = dict(zip(CLASSES, outputs))
+    result = dict(sorted(combined.items(), key=lambda item: item[1], reverse=True))
+    return "\t".join([f"[{k}]: {round(v*100, 2)}%" for k, v in result.items()])
+
+
+def image_vectors(paths):
+    # (path, pixels or the error of loading them) of every file and of the sorted images of every directory;
+    # directories are read through the dataset cache, only loose files are decoded
+    for path in paths:
+        if os.path.isdir(path):
+            try:
+                with stats.phase('load'):
+                    images = ImageDataset(path, DIGITS_W, DIGITS_H).load()
+            except (OSError, ValueError) as e:
+                yield path, e
+                continue
+            for row in range(len(images)):
+                yield images.path(row), images.vectors[row]
+        else:
+            try:
+                yield path, load_image_matrix(path)[1]
+            except (OSError, ValueError) as e:
+                yield path, e
+
+
+def make_network(backend: str = 'array') -> NeuralNetwork:
+    matrix = MATRIX_BACKENDS[backend]
+    inner_neuron = InnerNeuron(matrix(StoredMatrix(KEY_PRIMAL_WEIGHTS, DIGITS_SQUARE, PRIMAL_NEURONS_COUNT)))
+    outer_neuron = OuterNeuron(matrix(StoredMatrix(KEY_CLASS_WEIGHTS, PRIMAL_NEURONS_COUNT, CLASS_NEURONS_COUNT)))
+    return NeuralNetwork(inner_neuron, outer_neuron)
 
 
 @click.command()
 @click.argument('image', type=click.Path(exists=True))
 @click.argument('result', type=str)
-def learn(image: str, result):
+@click.option('--checkpoint', type=int, default=0, help="Store weights every N iterations (0 - only at the end).")
+@click.pass_context
+def learn(ctx: click.Context, image: str, result, checkpoint: int):
     """Learn a symbol from an image."""
     click.echo(f"Path is: {image}")
     click.echo(f"Expected result is: {result}")
@@ -196,52 +799,268 @@ def learn(image: str, result):
     click.echo(f"Data is: {im_data}")
     definitions = expected_learn_definitions(result)
     click.echo(f"Definitions are: {definitions}")
-    inner_neuron = InnerNeuron(KEY_PRIMAL_WEIGHTS, DIGITS_SQUARE, PRIMAL_NEURONS_COUNT)
-    outer_neuron = OuterNeuron(KEY_CLASS_WEIGHTS, PRIMAL_NEURONS_COUNT, CLASS_NEURONS_COUNT)
-    neural_net = NeuralNetwork(inner_neuron, outer_neuron)
-    neural_net.learn(im_data, definitions)
+    neural_net = make_network(ctx.obj['backend'])
+    neural_net.learn(im_data, definitions, checkpoint)
+    neural_net.flush()
+
+
+@click.command()
+@click.argument('directory', type=click.Path(exists=True, file_okay=False), default='learn')
+@click.option('--epochs', type=int, default=20)
+@click.option('--batch-size', type=int, default=1, help="Images per weights update.")
+@click.option('--checkpoint', type=int, default=0, help="Store weights every N epochs (0 - only at the end).")
+@click.option('--holdout', type=int, default=5, help="Last N images of every symbol are only tested.")
+@click.option('--seed', type=int, default=None, help="Seed of the epochs shuffle.")
+@click.option('--workers', type=int, default=0, help="Processes computing the gradients of a batch (0 - no pool).")
+@click.option('--staleness', type=int, default=0,
+              help="With workers, batches computed before the previous N updates are applied (0 - synchronous).")
+@click.pass_context
+def train(ctx: click.Context, directory: str, epochs: int, batch_size: int, checkpoint: int, holdout: int, seed,
+          workers: int, staleness: int):
+    """Learn all symbols of a directory in shuffled epochs."""
+    (inputs, expected), (test_inputs, test_expected) = load_dataset(directory, holdout)
+    if not len(inputs):
+        raise click.ClickException(f"No images of {', '.join(CLASSES)} to learn in {directory}")
+    click.echo(f"Learning {len(inputs)} images, testing {len(test_inputs)} images")
+    neural_net = make_network(ctx.obj['backend'])
+    if workers:
+        neural_net.train_parallel(inputs, expected, epochs, batch_size, workers, staleness, checkpoint,
+                                  random.Random(seed))
+    else:
+        neural_net.train(inputs, expected, epochs, batch_size, checkpoint, random.Random(seed))
+    neural_net.flush()
+    if len(test_inputs):
+        click.echo(f"Tested: {neural_net.accuracy(test_inputs, test_expected)}/{len(test_inputs)}")
 
 
 @click.command()
 @click.argument('image', type=click.Path(exists=True))
-def test(image: str):
+@click.pass_context
+def test(ctx: click.Context, image: str):
     """Test what a symbol is on image."""
     im_hash, im_data = load_image_matrix(image)
-    inner_neuron = InnerNeuron(KEY_PRIMAL_WEIGHTS, DIGITS_SQUARE, PRIMAL_NEURONS_COUNT)
-    outer_neuron = OuterNeuron(KEY_CLASS_WEIGHTS, PRIMAL_NEURONS_COUNT, CLASS_NEURONS_COUNT)
-    neural_net = NeuralNetwork(inner_neuron, outer_neuron)
+    neural_net = make_network(ctx.obj['backend'])
 
     outer_neuron_output = neural_net.result(im_data)
-    combined = dict(zip(CLASSES, outer_neuron_output))
-    result = dict(sorted(combined.items(), key=lambda item: item[1], reverse=True))
-    uf_results = [f"[{k}]: {round(v*100, 2)}%" for k, v in result.items()]
-    print("RESULT:\t", "\t".join(uf_results))
+    print("RESULT:\t", format_result(outer_neuron_output))
+
+
+class InferenceServer:
+    # classifies one image path per request line with the weights loaded once,
+    # reloading them only after the stored model version changes (the int8 model: after its file changes)
+    def __init__(self, backend: str, quantized: str = None) -> None:
+        self.backend = backend
+        self.quantized = quantized
+        self.version = None
+        self.load()
+
+    def load(self) -> None:
+        if self.quantized:
+            version = self.stored_version()
+            self.neural_net = QuantizedNetwork.load(self.quantized)
+            self.version = version
+        else:
+            self.neural_net = make_network(self.backend)
+            self.version = [self.neural_net.inner_neuron.matrix.version, self.neural_net.outer_neuron.matrix.version]
+
+    def loaded_version(self):
+        return self.version
+
+    def stored_version(self):
+        if self.quantized:
+            try:
+                return os.stat(self.quantized).st_mtime_ns
+            except OSError:
+                # removed file, keep the loaded model
+                return self.version
+        # both version counters in one round trip
+        keys = [self.neural_net.inner_neuron.matrix.version_key, self.neural_net.outer_neuron.matrix.version_key]
+        return [int(v or 0) for v in connect().mget(keys)]
+
+    def handle(self, line: str) -> str:
+        path = line.strip()
+        start_time = time.perf_counter()
+        if self.stored_version() != self.loaded_version():
+            try:
+                self.load()
+            except (KeyError, OSError, ValueError, zipfile.BadZipFile):
+                # counters bumped while the blobs are rewritten (init) or a model file half written,
+                # answer with the loaded model and reload on a later request
+                pass
+        try:
+            result = format_result(self.neural_net.result(load_image_matrix(path)[1]))
+        except (OSError, ValueError, KeyError) as e:
+            result = f"ERROR: {e}"
+        latency = (time.perf_counter() - start_time) * 1000
+        stats.event('request', path=path, milliseconds=latency)
+        return f"{path}\t{result}\t{latency:.3f}ms"
+
+    def serve_stream(self, requests, responses) -> None:
+        for line in requests:
+            if line.strip():
+                responses.write(self.handle(line) + "\n")
+                responses.flush()
+
+    def serve_socket(self, socket_path: str) -> None:
+        import socketserver
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if line.strip():
+                        self.wfile.write((server.handle(line.decode()) + "\n").encode())
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        with socketserver.UnixStreamServer(socket_path, Handler) as unix_server:
+            try:
+                unix_server.serve_forever()
+            finally:
+                os.unlink(socket_path)
+
+
+@click.command()
+@click.argument('paths', nargs=-1, type=click.Path(exists=True))
+@click.option('--batch-size', type=int, default=256, help="Images per forward pass.")
+@click.option('--quantized', type=click.Path(exists=True), default=None, help="Use an int8 model made by quantize.")
+@click.pass_context
+def classify(ctx: click.Context, paths, batch_size: int, quantized):
+    """Classify images and directories of images, paths are read from stdin if none are given."""
+    if not paths:
+        paths = (line.strip() for line in sys.stdin if line.strip())
+    neural_net = QuantizedNetwork.load(quantized) if quantized else make_network(ctx.obj['backend'])
+    start_time = time.perf_counter()
+    count = 0
+    batch = []
+    # None flushes the last batch, stdin is read as the paths arrive
+    for item in chain(image_vectors(paths), [None]):
+        if item is not None:
+            batch.append(item)
+        if batch and (item is None or len(batch) == batch_size):
+            # an image that can not be loaded gets an error line, like a serve request
+            inputs = [vector for _, vector in batch if not isinstance(vector, Exception)]
+            results = iter(neural_net.result(np.array(inputs, dtype=float)) if inputs else [])
+            for image, vector in batch:
+                if isinstance(vector, Exception):
+                    click.echo(f"{image}\tERROR: {vector}")
+                else:
+                    click.echo(f"{image}\t{format_result(next(results))}")
+            count += len(inputs)
+            batch = []
+    seconds = time.perf_counter() - start_time
+    click.echo(f"Classified {count} images in {seconds:.3f}s", err=True)
+
+
+@click.command()
+@click.option('--socket', 'socket_path', type=click.Path(), default=None,
+              help="Listen on a unix socket instead of stdin/stdout.")
+@click.option('--quantized', type=click.Path(exists=True), default=None, help="Use an int8 model made by quantize.")
+@click.pass_context
+def serve(ctx: click.Context, socket_path, quantized):
+    """Classify image paths sent one per line until stopped."""
+    server = InferenceServer(ctx.obj['backend'], quantized)
+    if socket_path:
+        server.serve_socket(socket_path)
+    else:
+        server.serve_stream(sys.stdin, sys.stdout)
+
+
+@click.command()
+@click.argument('output', type=click.Path(dir_okay=False), default='quantized.npz')
+@click.option('--directory', type=click.Path(exists=True, file_okay=False), default='learn',
+              help="Images to compare the int8 and the float results on.")
+@click.pass_context
+def quantize(ctx: click.Context, output: str, directory: str):
+    """Export the weights as an int8 inference model and compare it with the float network."""
+    neural_net = make_network(ctx.obj['backend'])
+    quantized = QuantizedNetwork.from_network(neural_net)
+    quantized.save(output)
+    (inputs, expected), _ = load_dataset(directory)
+    float_outputs = np.array(neural_net.result(inputs))
+    start_time = time.perf_counter()
+    int8_outputs = np.array(quantized.result(inputs))
+    int8_seconds = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    neural_net.result(inputs)
+    float_seconds = time.perf_counter() - start_time
+    truth = expected.argmax(axis=1)
+    float_bytes = neural_net.inner_neuron.matrix.weights.nbytes + neural_net.outer_neuron.matrix.weights.nbytes
+    click.echo(f"Stored {output}: the int8 model keeps {quantized.nbytes} bytes in memory, "
+               f"the float weights {float_bytes}")
+    click.echo(f"Float accuracy: {int((float_outputs.argmax(axis=1) == truth).sum())}/{len(truth)} in {float_seconds:.4f}s")
+    click.echo(f"Int8 accuracy: {int((int8_outputs.argmax(axis=1) == truth).sum())}/{len(truth)} in {int8_seconds:.4f}s")
+    click.echo(f"Same answer: {int((float_outputs.argmax(axis=1) == int8_outputs.argmax(axis=1)).sum())}/{len(truth)}, "
+               f"max output difference: {np.abs(float_outputs - int8_outputs).max():.4f}")
 
 
 @click.command()
 def init():
     click.echo("(Re)Initializing data...")
-    # re-init inner neuron weights matrix
-    inner_matrix = Neuron(KEY_PRIMAL_WEIGHTS, DIGITS_SQUARE, PRIMAL_NEURONS_COUNT)
-    inner_matrix.clean()
-    inner_matrix.create()
-    inner_matrix.init_weights()
-    # re-init outer neuron weights matrix
-    outer_matrix = Neuron(KEY_CLASS_WEIGHTS, PRIMAL_NEURONS_COUNT, CLASS_NEURONS_COUNT)
-    outer_matrix.clean()
-    outer_matrix.create()
-    outer_matrix.init_weights()
+    inner_matrix = StoredMatrix(KEY_PRIMAL_WEIGHTS, DIGITS_SQUARE, PRIMAL_NEURONS_COUNT)
+    outer_matrix = StoredMatrix(KEY_CLASS_WEIGHTS, PRIMAL_NEURONS_COUNT, CLASS_NEURONS_COUNT)
+    # re-init both weights matrices in one transaction
+    save_matrices([(matrix, random_weights(matrix.n, matrix.m, *INITIAL_WEIGHT_RANGE))
+                   for matrix in [inner_matrix, outer_matrix]], clean=True)
     # outer_matrix.print_matrix()
 
 
+@click.command()
+@click.option('--runs', type=int, default=5, help="Random networks to check.")
+@click.option('--tolerance', type=float, default=1e-9)
+def check(runs: int, tolerance: float):
+    """Check the matrix learn step against the per-element formulas."""
+    worst = 0.0
+    for _ in range(runs):
+        inner_weights = random_weights(DIGITS_SQUARE, PRIMAL_NEURONS_COUNT, *INITIAL_WEIGHT_RANGE)
+        outer_weights = random_weights(PRIMAL_NEURONS_COUNT, CLASS_NEURONS_COUNT, *INITIAL_WEIGHT_RANGE)
+        input_data = [random.choice([-1, 1]) for _ in range(DIGITS_SQUARE)]
+        expected_output = expected_learn_definitions(random.choice(CLASSES))
+        inner_neuron = InnerNeuron(MemoryMatrix('inner', inner_weights))
+        outer_neuron = OuterNeuron(MemoryMatrix('outer', outer_weights))
+        neural_net = NeuralNetwork(inner_neuron, outer_neuron)
+        neural_net.result(input_data)
+        outer_neuron.expected_output = np.asarray(expected_output)
+        outer_neuron.compute_weights()
+        inner_neuron.compute_weights(outer_neuron)
+        expected_inner, expected_outer = elementwise_step(inner_weights, outer_weights, input_data, expected_output)
+        worst = max(worst, np.abs(inner_neuron.matrix.weights - expected_inner).max(),
+                    np.abs(outer_neuron.matrix.weights - expected_outer).max())
+    click.echo(f"Max weight difference: {worst}")
+    if worst > tolerance:
+        raise click.ClickException(f"difference is above {tolerance}")
+
+
 @click.group()
-def numbers():
-    pass
+@click.option('--store', type=click.Choice(CLI_STORES), default=None,
+              help="Where the weights are kept: redis or files of NEURON_STORE_PATH (default NEURON_STORE or redis).")
+@click.option('--backend', type=click.Choice(list(MATRIX_BACKENDS)), default='array',
+              help="Keep weights in memory (array) or read/write them in the store on every step (store).")
+@click.option('--stats', 'stats_output', type=click.File('w'), default=None,
+              help="Write phase timers, store counters and per sample/epoch events as JSON lines ('-' for stdout).")
+@click.pass_context
+def numbers(ctx: click.Context, store, backend: str, stats_output):
+    from dotenv import load_dotenv
+    load_dotenv()
+    store = store or os.getenv('NEURON_STORE', 'redis')
+    if store not in CLI_STORES:
+        raise click.UsageError(f"NEURON_STORE must be one of {', '.join(CLI_STORES)}, not {store}")
+    use_store(store)
+    ctx.ensure_object(dict)
+    ctx.obj['backend'] = backend
+    if stats_output:
+        stats.enable(stats_output)
+        ctx.call_on_close(stats.close)
 
 
 numbers.add_command(learn)
+numbers.add_command(train)
 numbers.add_command(test)
+numbers.add_command(classify)
+numbers.add_command(serve)
+numbers.add_command(quantize)
 numbers.add_command(init)
+numbers.add_command(check)
 
 if __name__ == '__main__':
     numbers()
@@ -1,5 +1,16 @@
-from PIL import Image
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
 import os
+import sys
+import numpy as np
+
+# the dataset cache is shared with the other labs
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dataset import ImageDataset, file_hash, load_image
 
 DISTORTED_DIGITS_DIR = "distorted"
 DIGITS_DIR = "digits"
@@ -7,95 +18,487 @@ DIGITS_NAMES = ['2', '3', '4', '5']
 DIGITS_W = 10
 DIGITS_H = 10
 DIGITS_SQUARE = DIGITS_W * DIGITS_H
-DIGITS_HASHES = {}
+MAX_LOOPS = 100
+# recall uses the patterns instead of the w-matrix once they are this many times fewer than the neurons
+FACTORED_RATIO = 8
+# bigger networks keep no w-matrix at all, only the patterns
+DENSE_SIZE_LIMIT = 4096
+# the factored recall takes the pattern overlaps from the bit-packed patterns (XOR + popcount) above this
+# many neurons, below it the float product is faster
+PACKED_SIZE_LIMIT = 2048
+
 
+def make_memory(matrixes: list) -> np.ndarray:
+    # w-matrix is the sum of the patterns outer products, no neuron is connected to itself
+    patterns = np.asarray(matrixes, dtype=np.int32)
+    memory = patterns.T @ patterns
+    np.fill_diagonal(memory, 0)
+    return memory
 
-def empty_matrix(size: int) -> list:
-    return [[0] * size for _ in range(size)]
 
+class RecallStats:
+    # what one recognition did: sweeps over all neurons, flipped neurons and how it ended:
+    # converged, cycled (synchronous mode only) or limit (max_loops sweeps without converging)
+    def __init__(self) -> None:
+        self.sweeps = 0
+        self.flips = 0
+        self.status = 'limit'
 
-def empty_list(size: int) -> list:
-    return [0 for _ in range(size)]
+    def __str__(self) -> str:
+        return f"{self.status}, {self.sweeps} sweep(s), {self.flips} flip(s)"
 
 
-def load_image_matrix(image_path: str) -> tuple[int, list]:
-    with Image.open(image_path) as im:
-        # resize to 10x10
-        if im.size != (DIGITS_W, DIGITS_H):
-            im = im.resize((DIGITS_W, DIGITS_H))
-        # convert images to a 1-bit pixels, black and white, stored with one pixel per byte:
-        # https://pillow.readthedocs.io/en/latest/handbook/concepts.html#concept-modes
-        im = im.convert('1', colors=2)
-        # convert 0:255 to 1:-1
-        picture_data = list(map(lambda p: -1 if p == 255 else 1, list(im.getdata())))
-        return hash(tuple(picture_data)), picture_data
+class FactoredMemory:
+    # w-matrix of K patterns X (K x N) without building it: w = Xt X - K I, so the field
+    # y w = (y Xt) X - K y costs O(N K) and the N x N matrix never exists
+    # numpy leaves `y @ memory` to __rmatmul__
+    __array_ufunc__ = None
 
+    def __init__(self, matrixes) -> None:
+        # float64 products go through BLAS and integer fields stay exact
+        self.patterns = np.asarray(matrixes, dtype=np.float64)
+        self.count, self.size = self.patterns.shape
+        self.shape = (self.size, self.size)
+        self.index = PatternIndex(list(range(self.count)), self.patterns) if self.size > PACKED_SIZE_LIMIT else None
 
-def make_memory(matrixes: list[list]) -> list[list[int]]:
-    memory = empty_matrix(DIGITS_SQUARE)
-    # fill w-matrix with computed values
-    for i in range(DIGITS_SQUARE):
-        for j in range(DIGITS_SQUARE):
-            for k in range(len(matrixes)):
-                if i != j:
-                    memory[i][j] += matrixes[k][i] * matrixes[k][j]
-    return memory
+    def __rmatmul__(self, y):
+        if self.index is None:
+            return (y @ self.patterns.T) @ self.patterns - self.count * y
+        # the states are ±1, their overlaps y Xt are counted on the packed bits
+        y = np.asarray(y)
+        overlaps = self.index.overlaps(y.reshape(-1, self.size)).reshape(y.shape[:-1] + (self.count,))
+        return overlaps @ self.patterns - self.count * y
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        # one row of the w-matrix
+        row = self.patterns[:, i] @ self.patterns
+        row[i] = 0
+        return row
+
+
+# set bits of every byte value, for numpy without bitwise_count
+POPCOUNT_TABLE = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def pack_bits(vectors) -> np.ndarray:
+    # ±1 vectors (..., N) as uint64 words (..., ceil(N / 64)), bit set for 1
+    bits = np.packbits(np.asarray(vectors) > 0, axis=-1, bitorder='little')
+    padding = -bits.shape[-1] % 8
+    if padding:
+        bits = np.concatenate([bits, np.zeros(bits.shape[:-1] + (padding,), dtype=np.uint8)], axis=-1)
+    return np.ascontiguousarray(bits).view(np.uint64)
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    # set bits of every uint64 word
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    return POPCOUNT_TABLE[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1)
+
+
+class PatternIndex:
+    # stored patterns bit-packed into uint64 words, compared with recognition results by XOR + popcount;
+    # the inverted pattern is a fixed point of the network as well and is matched to its pattern too
+    def __init__(self, labels: list[str], matrixes: np.ndarray) -> None:
+        # matrixes is K x N, K may be 0
+        self.labels = labels
+        self.count, self.size = matrixes.shape
+        self.words = pack_bits(matrixes)
+
+    def distances(self, vectors) -> np.ndarray:
+        # Hamming distance of every vector (B x N) to every pattern, B x K
+        packed = pack_bits(vectors).reshape(len(vectors), 1, -1)
+        return popcount(packed ^ self.words).sum(axis=-1).astype(np.int64)
+
+    def overlaps(self, vectors) -> np.ndarray:
+        # ±1 dot products with the patterns: matching bits minus differing bits
+        return self.size - 2 * self.distances(vectors)
 
+    def energy(self, vectors) -> np.ndarray:
+        # -1/2 y w y of the w-matrix of these patterns, from the overlaps only
+        overlaps = self.overlaps(vectors)
+        return 0.5 * (self.count * self.size - (overlaps ** 2).sum(axis=1))
 
-def recognize(image_matrix: list, memory: list[list[int]]):
-    # original state slice
-    y = image_matrix[:]
-    loops_count = 0
+    def nearest(self, vectors) -> list[tuple[str | None, int, int, bool]]:
+        # (label, distance, margin to the next pattern, inverted) for every vector,
+        # label None and distance N when no pattern is stored
+        if not self.count:
+            return [(None, self.size, 0, False) for _ in range(len(vectors))]
+        distances = self.distances(vectors)
+        inverted = distances > self.size - distances
+        distances = np.minimum(distances, self.size - distances)
+        matches = []
+        for row, row_inverted in zip(distances, inverted):
+            best = int(np.argmin(row))
+            others = np.delete(row, best)
+            margin = int(others.min() - row[best]) if len(others) else self.size
+            matches.append((self.labels[best], int(row[best]), margin, bool(row_inverted[best])))
+        return matches
+
+
+def recognize(image_matrix, memory: np.ndarray, mode: str = 'sync', order: str = 'sequential',
+              max_loops: int = MAX_LOOPS, rng: np.random.Generator = None) -> tuple[np.ndarray, RecallStats]:
+    if mode == 'async':
+        return recognize_async(image_matrix, memory, order, max_loops, rng)
+    stats = RecallStats()
+    # original state copy
+    y = np.array(image_matrix, dtype=np.int32)
+    # states met so far, synchronous updates may swing between two states forever
+    seen = {y.tobytes()}
     # start recognition
-    while True:
-        loops_count += 1
+    while stats.sweeps < max_loops:
+        stats.sweeps += 1
         # compute new neurons state
-        s = empty_list(DIGITS_SQUARE)
-        for i in range(DIGITS_SQUARE):
-            for j in range(DIGITS_SQUARE):
-                s[j] += y[i] * memory[i][j]
-        # slice to result from current state
-        y_res = y[:]
-        for i in range(DIGITS_SQUARE):
-            # apply neuron state to a result instance
-            if s[i] < 0:
-                y_res[i] = -1
-            elif s[i] > 0:
-                y_res[i] = 1
+        s = y @ memory
+        # neurons with a positive field turn to 1, negative to -1, zero field keeps the state
+        y_res = np.where(s < 0, -1, np.where(s > 0, 1, y))
+        stats.flips += int(np.count_nonzero(y_res != y))
         # break infinite loop in case
         # when original state is equal to result state
-        if y == y_res:
+        if np.array_equal(y, y_res):
+            stats.status = 'converged'
             break
+        if y_res.tobytes() in seen:
+            stats.status = 'cycled'
+            y = y_res
+            break
+        seen.add(y_res.tobytes())
         # or assign result state as original
         y = y_res
-    # return
-    return y, loops_count
-
-
-# import original images
-pictures_matrix = []
-for im_num in DIGITS_NAMES:
-    im_path = os.path.join(DIGITS_DIR, im_num + ".gif")
-    im_hash, im_matrix = load_image_matrix(im_path)
-    # print(im_path, im_hash)
-    pictures_matrix.append(im_matrix)
-    DIGITS_HASHES.setdefault(im_hash, im_num)
-
-# print(pictures_matrix)
-
-# build w-matrix (Матриця вагових коефіцієнтів)
-w = make_memory(pictures_matrix)
-
-# walk through all distorted and original images in the directory
-for distorted_im in sorted(next(os.walk(DISTORTED_DIGITS_DIR), (None, None, []))[2]):
-    # build distorted image matrix
-    dim_hash, dim_matrix = load_image_matrix(os.path.join(DISTORTED_DIGITS_DIR, distorted_im))
-    # try to recognize the distorted image
-    result_matrix, loops = recognize(dim_matrix, w)
-    result_hash = hash(tuple(result_matrix))
-    # print result
-    if result_hash in DIGITS_HASHES:
-        print(f"File {distorted_im} recognized as {DIGITS_HASHES[result_hash]} with {loops} loop(s)")
-    else:
-        print(f"File {distorted_im} NOT recognized with {loops} loop(s)!")
+    return y, stats
+
+
+def recognize_async(image_matrix, memory: np.ndarray, order: str = 'sequential',
+                    max_loops: int = MAX_LOOPS, rng: np.random.Generator = None) -> tuple[np.ndarray, RecallStats]:
+    # one neuron at a time, in index or random order; the field of every neuron is computed once
+    # and then corrected by one memory row per flipped neuron (the memory is symmetric)
+    stats = RecallStats()
+    y = np.array(image_matrix, dtype=np.int32)
+    field = y @ memory
+    rng = rng or np.random.default_rng()
+    while stats.sweeps < max_loops:
+        stats.sweeps += 1
+        flipped = False
+        neurons = rng.permutation(len(y)) if order == 'random' else range(len(y))
+        for i in neurons:
+            # zero field keeps the state
+            new_state = 1 if field[i] > 0 else -1 if field[i] < 0 else y[i]
+            if new_state != y[i]:
+                field += 2 * new_state * memory[i]
+                y[i] = new_state
+                stats.flips += 1
+                flipped = True
+        if not flipped:
+            stats.status = 'converged'
+            break
+    return y, stats
+
+
+class HopfieldMemory:
+    # stored patterns in a list (.json: label, source image, sha1 of the source and the pattern itself, as the hex
+    # of its bit-packed uint64 words) and,
+    # only while recall uses it, their w-matrix persisted in `path` (int32 N x N .npy, memory-mapped);
+    # storage is additive, add() and forget() change the mapped matrix by one outer product.
+    # The index and the .sha1 next to the matrix keep the digest of the patterns the matrix was made of,
+    # a matrix whose digest does not match (an add or forget interrupted half way) is built again
+    CAPACITY_RATIO = 0.14
+
+    def __init__(self, size: int, path: str = None) -> None:
+        self.size = size
+        self.path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), f"memory_{size}.npy")
+        self.index_path = os.path.splitext(self.path)[0] + ".json"
+        self.digest_path = os.path.splitext(self.path)[0] + ".sha1"
+        self.lock_path = os.path.splitext(self.path)[0] + ".lock"
+        self.loaded = False
+        self.weights = None
+        self.patterns = []
+        self.digest = None
+
+    def load(self) -> 'HopfieldMemory':
+        if self.loaded:
+            return self
+        if not os.path.exists(self.index_path):
+            self.create()
+        with open(self.index_path) as f:
+            index = json.load(f)
+        self.patterns = index['patterns']
+        self.digest = index.get('digest')
+        for stored in self.patterns:
+            if 'pattern' in stored:
+                # indexes written before the patterns were packed keep them as '0'/'1' text; the digest
+                # changes with them, so the matrix is built again once
+                bits = np.frombuffer(stored.pop('pattern').encode(), dtype=np.uint8) == ord('1')
+                stored['words'] = self.pack(np.where(bits, 1, -1))
+        self.loaded = True
+        self.sync_weights()
+        return self
+
+    def create(self) -> None:
+        self.patterns = []
+        self.save_index()
+
+    @contextmanager
+    def locked(self):
+        # add() and forget() of other processes wait; the index and the matrix are read again under the lock
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.loaded = False
+            self.weights = None
+            yield self.load()
+
+    def dense(self) -> bool:
+        # recall goes through the w-matrix once the patterns are too many for the factored form,
+        # networks above DENSE_SIZE_LIMIT neurons recall from the patterns in any case
+        return self.size <= DENSE_SIZE_LIMIT and len(self.patterns) * FACTORED_RATIO > self.size
+
+    def sync_weights(self) -> None:
+        # map the w-matrix file when recall needs it, building it from the patterns if it is missing,
+        # foreign or out of step with the index, and remove it when recall does not
+        if not self.dense():
+            self.weights = None
+            for path in [self.digest_path, self.path]:
+                if os.path.exists(path):
+                    os.remove(path)
+            return
+        if self.weights is None and os.path.exists(self.path):
+            weights = np.load(self.path, mmap_mode='r+')
+            if weights.shape == (self.size, self.size) and self.digest and self.matrix_digest() == self.digest:
+                self.weights = weights
+        if self.weights is None:
+            np.save(self.path, make_memory(self.pattern_matrix()))
+            self.weights = np.load(self.path, mmap_mode='r+')
+            self.save_digest()
 
+    def pattern_digest(self) -> str:
+        return hashlib.sha1("\n".join(stored['words'] for stored in self.patterns).encode()).hexdigest()
+
+    def matrix_digest(self) -> str | None:
+        if not os.path.exists(self.digest_path):
+            return None
+        with open(self.digest_path) as f:
+            return f.read().strip()
+
+    def save_digest(self) -> None:
+        # the matrix is made of the patterns in memory, whether their index is saved yet or not
+        if self.weights is None:
+            return
+        with open(self.digest_path + ".tmp", 'w') as f:
+            f.write(self.pattern_digest())
+        os.replace(self.digest_path + ".tmp", self.digest_path)
+
+    def save_index(self) -> None:
+        # the weights are flushed first, the index is swapped in after them and the matrix digest last
+        self.digest = self.pattern_digest()
+        with open(self.index_path + ".tmp", 'w') as f:
+            json.dump({'size': self.size, 'digest': self.digest, 'patterns': self.patterns}, f)
+        os.replace(self.index_path + ".tmp", self.index_path)
+        self.save_digest()
+
+    def learn(self, pattern: np.ndarray, sign: int) -> None:
+        if self.weights is None:
+            return
+        # the matrix stops matching any index until save_index() is done
+        if os.path.exists(self.digest_path):
+            os.remove(self.digest_path)
+        pattern = np.asarray(pattern, dtype=np.int32)
+        self.weights += sign * np.outer(pattern, pattern)
+        np.fill_diagonal(self.weights, 0)
+        self.weights.flush()
+
+    def add(self, pattern, label: str, source: str = None) -> None:
+        # a label is stored once, adding it again replaces the old pattern
+        with self.locked():
+            index = self.find(label)
+            if index is not None:
+                self.remove(index)
+            self.learn(pattern, 1)
+            self.patterns.append({
+                'label': label,
+                'source': source,
+                'sha1': file_hash(source) if source else None,
+                'words': self.pack(pattern),
+            })
+            self.sync_weights()
+            self.save_index()
+
+    def forget(self, label: str) -> None:
+        with self.locked():
+            index = self.find(label)
+            if index is None:
+                raise KeyError(f"pattern {label} is not stored")
+            self.remove(index)
+            self.sync_weights()
+            self.save_index()
+
+    def remove(self, index: int) -> None:
+        self.learn(self.pattern(index), -1)
+        del self.patterns[index]
+
+    def find(self, label: str) -> int | None:
+        for index, stored in enumerate(self.patterns):
+            if stored['label'] == label:
+                return index
+        return None
+
+    @staticmethod
+    def pack(pattern) -> str:
+        # the little endian bytes of the packed words, the same on every platform
+        return pack_bits(pattern).tobytes().hex()
+
+    def pattern(self, index: int) -> np.ndarray:
+        words = np.frombuffer(bytes.fromhex(self.patterns[index]['words']), dtype=np.uint8)
+        bits = np.unpackbits(words, bitorder='little')[:self.size]
+        return np.where(bits, 1, -1).astype(np.int32)
+
+    def pattern_matrix(self) -> np.ndarray:
+        # stored patterns as rows, K x N
+        patterns = [self.pattern(index) for index in range(len(self.patterns))]
+        return np.array(patterns, dtype=np.int32).reshape(len(patterns), self.size)
+
+    def recall_memory(self):
+        # the mapped w-matrix when it is kept, the factored form of the patterns otherwise
+        self.load()
+        if self.weights is None:
+            return FactoredMemory(self.pattern_matrix())
+        return self.weights
+
+    def refresh(self) -> list[str]:
+        # stored patterns whose source image changed are learned again, returns their labels
+        changed = []
+        for stored in list(self.load().patterns):
+            source = stored['source']
+            if source and os.path.exists(source) and file_hash(source) != stored['sha1']:
+                self.add(load_image(source, DIGITS_W, DIGITS_H), stored['label'], source)
+                changed.append(stored['label'])
+        return changed
+
+    def capacity(self) -> tuple[int, int]:
+        # (stored patterns, patterns the network recalls reliably)
+        return len(self.load().patterns), int(self.CAPACITY_RATIO * self.size)
+
+
+def recognize_batch(images, memory: np.ndarray, max_loops: int = MAX_LOOPS,
+                    workers: int = 0, chunk_size: int = None) -> tuple[np.ndarray, list[RecallStats]]:
+    # synchronous recognition of many images at once, one row per image: a sweep is one matrix product
+    # of the rows still changing, every row stops on its own once it converges or cycles;
+    # with workers the images go out in chunks, by default one chunk per worker
+    if workers and len(images) > 1:
+        chunk_size = chunk_size or -(-len(images) // workers)
+        chunks = [images[start:start + chunk_size] for start in range(0, len(images), chunk_size)]
+        # the memory goes to every worker once, not with every chunk
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_recognize_worker, initargs=(memory,)) as pool:
+            results = list(pool.map(recognize_chunk, chunks, [max_loops] * len(chunks)))
+        return np.concatenate([states for states, _ in results]), [s for _, stats in results for s in stats]
+    # float64 products go through BLAS and integer fields stay exact
+    y = np.array(images, dtype=np.float64)
+    if not isinstance(memory, FactoredMemory):
+        memory = np.asarray(memory, dtype=np.float64)
+    sweeps = np.zeros(len(y), dtype=int)
+    flips = np.zeros(len(y), dtype=int)
+    statuses = np.full(len(y), 'limit', dtype=object)
+    active = np.arange(len(y))
+    # states two sweeps back of the active rows, a synchronous network cycles through two states at most
+    before = None
+    for sweep in range(1, max_loops + 1):
+        if not len(active):
+            break
+        current = y[active]
+        s = current @ memory
+        y_res = np.where(s < 0, -1, np.where(s > 0, 1, current))
+        sweep_flips = np.count_nonzero(y_res != current, axis=1)
+        converged = sweep_flips == 0
+        cycled = ~converged & (y_res == before).all(axis=1) if before is not None else np.zeros(len(active), dtype=bool)
+        y[active] = y_res
+        sweeps[active] = sweep
+        flips[active] += sweep_flips
+        statuses[active[converged]] = 'converged'
+        statuses[active[cycled]] = 'cycled'
+        changing = ~(converged | cycled)
+        before = current[changing]
+        active = active[changing]
+    stats = [RecallStats() for _ in range(len(y))]
+    for row_stats, row_sweeps, row_flips, row_status in zip(stats, sweeps.tolist(), flips.tolist(), statuses):
+        row_stats.sweeps, row_stats.flips, row_stats.status = row_sweeps, row_flips, row_status
+    return y.astype(np.int32), stats
+
+
+# memory of a recognition worker process, sent once by the pool initializer
+worker_memory = None
+
+
+def init_recognize_worker(memory) -> None:
+    global worker_memory
+    worker_memory = memory
+
+
+def recognize_chunk(images, max_loops: int) -> tuple[np.ndarray, list[RecallStats]]:
+    return recognize_batch(images, worker_memory, max_loops)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Recognize distorted digits with a Hopfield network")
+    parser.add_argument('--mode', choices=['sync', 'async'], default='sync', help="update all neurons at once or one by one")
+    parser.add_argument('--order', choices=['sequential', 'random'], default='sequential', help="neurons order of the async mode")
+    parser.add_argument('--max-loops', type=int, default=MAX_LOOPS, help="sweeps before a recognition gives up")
+    parser.add_argument('--seed', type=int, default=None, help="seed of the random async order")
+    parser.add_argument('--stats', action='store_true', help="print flips, sweeps and how every recognition ended")
+    parser.add_argument('--workers', type=int, default=0, help="processes sharing the synchronous batch (0 - no pool)")
+    commands = parser.add_subparsers(dest='command', help="change the stored memory instead of recognizing")
+    add_parser = commands.add_parser('add', help="store an image, replacing the pattern of the same label")
+    add_parser.add_argument('image')
+    add_parser.add_argument('--label', help="stored name, the image name before '-' or '.' by default")
+    forget_parser = commands.add_parser('forget', help="remove a stored pattern")
+    forget_parser.add_argument('label')
+    commands.add_parser('capacity', help="stored patterns against the ~0.14*N limit")
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    # w-matrix (Матриця вагових коефіцієнтів) is kept in a file, the first run stores the original images
+    memory = HopfieldMemory(DIGITS_SQUARE)
+    if not os.path.exists(memory.index_path):
+        digits = ImageDataset(DIGITS_DIR, DIGITS_W, DIGITS_H).load()
+        for im_num in DIGITS_NAMES:
+            memory.add(digits.vectors[digits.names.index(im_num + ".gif")], im_num, os.path.join(DIGITS_DIR, im_num + ".gif"))
+    for label in memory.refresh():
+        print(f"Pattern {label} changed, learned again")
+
+    if args.command == 'add':
+        label = args.label or os.path.basename(args.image).split('.')[0].split('-')[0]
+        memory.add(load_image(args.image, DIGITS_W, DIGITS_H), label, args.image)
+        print(f"Stored {label} from {args.image}")
+    elif args.command == 'forget':
+        if memory.find(args.label) is None:
+            parser.error(f"pattern {args.label} is not stored")
+        memory.forget(args.label)
+        print(f"Forgot {args.label}")
+    if args.command is not None:
+        stored, limit = memory.capacity()
+        print(f"Stored {stored} pattern(s) of ~{limit} ({stored / limit:.0%} of capacity): "
+              f"{', '.join(pattern['label'] for pattern in memory.patterns)}")
+        if stored > limit:
+            print("Over capacity, recognition becomes unreliable")
+        sys.exit()
+
+    index = PatternIndex([pattern['label'] for pattern in memory.patterns], memory.pattern_matrix())
+    w = memory.recall_memory()
+
+    # walk through all distorted and original images in the directory
+    distorted = ImageDataset(DISTORTED_DIGITS_DIR, DIGITS_W, DIGITS_H).load()
+    # try to recognize the distorted images, all of them at once in the synchronous mode
+    if args.mode == 'sync':
+        results = zip(*recognize_batch(distorted.vectors, w, args.max_loops, args.workers))
+    else:
+        results = (recognize(dim_vector, w, args.mode, args.order, args.max_loops, rng) for dim_vector in distorted.vectors)
+    for distorted_im, (result_matrix, recall_stats) in zip(distorted.names, results):
+        loops = recall_stats.sweeps
+        label, distance, margin, inverted = index.nearest([result_matrix])[0]
+        # print result
+        if distance == 0 and not inverted:
+            print(f"File {distorted_im} recognized as {label} with {loops} loop(s)")
+        elif label is None:
+            print(f"File {distorted_im} NOT recognized with {loops} loop(s)! No patterns stored")
+        else:
+            print(f"File {distorted_im} NOT recognized with {loops} loop(s)! "
+                  f"Nearest: {'inverted ' if inverted else ''}{label}, distance {distance}, margin {margin}")
+        if args.stats:
+            print(f"    {recall_stats}, energy {index.energy([result_matrix])[0]:g}")